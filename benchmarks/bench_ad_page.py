@@ -0,0 +1,34 @@
+import logging
+import os
+import timeit
+
+from src.utils import kufar_api
+
+FIXTURE_FILE = os.path.join(os.path.dirname(__file__), "fixtures", "ad_page.html")
+ITERATIONS = 50
+
+
+def main():
+    logging.disable(logging.INFO)
+    with open(FIXTURE_FILE, encoding="utf-8") as f:
+        html = f.read()
+
+    full_result = kufar_api.parse_ad_page_full(html, "bench")
+    fast_result = kufar_api.parse_ad_page(html, "bench")
+    assert full_result == fast_result, "Быстрый разбор дает другой результат"
+
+    full_time = timeit.timeit(
+        lambda: kufar_api.parse_ad_page_full(html, "bench"), number=ITERATIONS
+    )
+    fast_time = timeit.timeit(
+        lambda: kufar_api.parse_ad_page(html, "bench"), number=ITERATIONS
+    )
+
+    print(f"Страница: {len(html) / 1024:.0f} КБ, итераций: {ITERATIONS}")
+    print(f"Полный BeautifulSoup: {full_time / ITERATIONS * 1000:.2f} мс/страница")
+    print(f"Разбор блоков:        {fast_time / ITERATIONS * 1000:.2f} мс/страница")
+    print(f"Ускорение: x{full_time / fast_time:.1f}")
+
+
+if __name__ == "__main__":
+    main()
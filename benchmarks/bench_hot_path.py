@@ -0,0 +1,111 @@
+import argparse
+import json
+import logging
+import os
+import random
+
+from benchmarks.measure import load_results, measure, print_results, save_results
+from src.utils import kufar_api, planner
+from src.utils.ad import Ad
+from src.utils.kufar_cities import ALL_CITIES, CITIES
+from src.utils.registry import get_query_key
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+QUERY_COUNTS = (1000, 10000)
+
+
+def load_fixtures() -> tuple[list, str]:
+    with open(
+        os.path.join(FIXTURES_DIR, "search_response.json"), encoding="utf-8"
+    ) as f:
+        raw_ads = json.load(f)["ads"]
+    with open(os.path.join(FIXTURES_DIR, "ad_page.html"), encoding="utf-8") as f:
+        html = f.read()
+    return raw_ads, html
+
+
+def generate_query_keys(count: int) -> list:
+    # A few users share every search text, like in real data: cities and
+    # price ranges differ, so searches are coalesced into groups.
+    rng = random.Random(count)
+    texts = [f"товар {index}" for index in range(max(1, count // 4))]
+    query_keys = []
+    for _ in range(count):
+        query = {"query": rng.choice(texts), "city": rng.choice(CITIES + [ALL_CITIES])}
+        if rng.random() < 0.3:
+            query["price_min"] = rng.randint(0, 500)
+            query["price_max"] = query["price_min"] + rng.randint(100, 3000)
+        if rng.random() < 0.2:
+            query["only_title_search"] = True
+        query_keys.append(get_query_key(query))
+    return query_keys
+
+
+def match_burst(plan: dict, ads: list):
+    # The per-group step of Poller.check_group for a burst of new ads.
+    for member_keys in plan.values():
+        group_params = planner.get_group_params(member_keys)
+        for query_key in member_keys:
+            planner.filter_ads_for_query(
+                ads, dict(query_key), group_params["city"], use_limit=False
+            )
+
+
+def run_benchmarks(raw_ads: list, html: str) -> list:
+    details = kufar_api.parse_ad_page(html, "bench")
+    ads = [Ad.from_api(ad) for ad in raw_ads]
+    results = [
+        measure(
+            "Ad.from_api",
+            lambda: [Ad.from_api(ad) for ad in raw_ads],
+            len(raw_ads),
+        ),
+        measure(
+            "format_ad_message",
+            lambda: [kufar_api.format_ad_message(ad, details) for ad in ads],
+            len(ads),
+        ),
+        measure(
+            "extract_block_html",
+            lambda: kufar_api.extract_block_html(html, "seller-block"),
+            1,
+        ),
+        measure("parse_ad_page", lambda: kufar_api.parse_ad_page(html, "bench"), 1),
+    ]
+
+    for count in QUERY_COUNTS:
+        query_keys = generate_query_keys(count)
+        plan = planner.build_plan(query_keys)
+        results.append(
+            measure(
+                f"build_plan, {count} запросов",
+                lambda: planner.build_plan(query_keys),
+                count,
+            )
+        )
+        results.append(
+            measure(
+                f"{len(ads)} объявлений x {count} запросов",
+                lambda: match_burst(plan, ads),
+                count,
+            )
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки обработки объявлений")
+    parser.add_argument("--save", help="сохранить результаты в JSON-файл")
+    parser.add_argument("--compare", help="сравнить с результатами из JSON-файла")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    raw_ads, html = load_fixtures()
+    results = run_benchmarks(raw_ads, html)
+    print_results(results, load_results(args.compare) if args.compare else None)
+    if args.save:
+        save_results(results, args.save)
+
+
+if __name__ == "__main__":
+    main()
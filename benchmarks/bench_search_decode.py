@@ -0,0 +1,83 @@
+import json
+import logging
+import os
+import pickle
+import tracemalloc
+
+from benchmarks.measure import measure, print_results
+from src.utils import kufar_api
+from src.utils.ad import Ad
+
+FIXTURE_FILE = os.path.join(
+    os.path.dirname(__file__), "fixtures", "search_response.json"
+)
+
+
+def get_fields(ad: Ad) -> tuple:
+    return tuple(getattr(ad, name) for name in Ad.__slots__)
+
+
+def decode_full(content: bytes) -> list:
+    return json.loads(content)["ads"]
+
+
+def retained_bytes(func) -> int:
+    # Memory still held by the decoded ads once parsing is over: this is what
+    # sits in queues, caches and what is pickled to the main process.
+    tracemalloc.start()
+    result = func()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def main():
+    logging.disable(logging.INFO)
+    with open(FIXTURE_FILE, "rb") as f:
+        content = f.read()
+
+    full_ads = decode_full(content)
+    selected_ads, _ = kufar_api.parse_search_response(content)
+    assert [get_fields(Ad.from_api(ad)) for ad in full_ads] == [
+        get_fields(ad) for ad in selected_ads
+    ], "Выборочный разбор дает другой результат"
+
+    codecs = [("json", None)]
+    if kufar_api.orjson is not None:
+        codecs.append(("orjson", kufar_api.orjson))
+    else:
+        print("orjson не установлен, быстрый декодер пропущен.")
+
+    results = [measure("json.loads целиком", lambda: decode_full(content), 1)]
+    retained = [retained_bytes(lambda: decode_full(content))]
+    for codec_name, codec in codecs:
+        kufar_api.orjson = codec
+        results.append(
+            measure(
+                f"выборочно, {codec_name}",
+                lambda: kufar_api.parse_search_response(content),
+                1,
+            )
+        )
+        retained.append(
+            retained_bytes(lambda: kufar_api.parse_search_response(content))
+        )
+    kufar_api.orjson = codecs[-1][1]
+
+    print(
+        f"Ответ поиска: {len(content) / 1024:.0f} КБ, {len(full_ads)} объявлений; "
+        f"операция - разбор одного ответа."
+    )
+    print_results(results)
+    print()
+    print(f"{'Хранится после разбора':<44} {'в памяти':>14} {'pickle':>12}")
+    pickled = [len(pickle.dumps(full_ads))] + [len(pickle.dumps(selected_ads))] * (
+        len(results) - 1
+    )
+    for result, held, size in zip(results, retained, pickled):
+        print(f"{result.name:<44} {held / 1024:>11,.1f} КБ {size / 1024:>9,.1f} КБ")
+
+
+if __name__ == "__main__":
+    main()
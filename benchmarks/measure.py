@@ -0,0 +1,72 @@
+import gc
+import json
+import time
+import tracemalloc
+
+
+class Result:
+    def __init__(self, name: str, ops: int, seconds: float, peak_bytes: int):
+        self.name = name
+        self.ops = ops
+        self.seconds = seconds
+        self.peak_bytes = peak_bytes
+
+    @property
+    def ops_per_second(self) -> float:
+        return self.ops / self.seconds if self.seconds else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "ops_per_second": self.ops_per_second,
+            "peak_bytes": self.peak_bytes,
+        }
+
+
+def measure(name: str, func, ops: int, min_time: float = 0.5) -> Result:
+    # Speed is timed without tracemalloc (it slows Python down several times),
+    # memory is measured on a separate single run.
+    func()
+    gc.collect()
+    repeats, seconds = 0, 0.0
+    while seconds < min_time:
+        start = time.perf_counter()
+        func()
+        seconds += time.perf_counter() - start
+        repeats += 1
+
+    gc.collect()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    func()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return Result(name, ops * repeats, seconds, peak_bytes)
+
+
+def print_results(results: list, baseline: dict | None = None):
+    print(f"{'Сценарий':<44} {'опер./сек':>14} {'пик памяти':>12}")
+    for result in results:
+        line = (
+            f"{result.name:<44} {result.ops_per_second:>14,.0f} "
+            f"{result.peak_bytes / 1024:>9,.1f} КБ"
+        )
+        if baseline and result.name in baseline:
+            before = baseline[result.name]["ops_per_second"]
+            if before:
+                line += f"  ({(result.ops_per_second / before - 1) * 100:+.1f}%)"
+        print(line)
+
+
+def save_results(results: list, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {result.name: result.to_dict() for result in results},
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+
+
+def load_results(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,180 @@
+import asyncio
+import itertools
+import random
+import time
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+from src.utils.kufar_cities import CITY_LOCATIONS
+
+CATALOG_SIZE = 200
+REGIONAL_CITIES = [
+    (city_name, location) for city_name, location in CITY_LOCATIONS.items() if location
+]
+# Smallest valid JPEG-like payload is enough: the bot only forwards the bytes.
+IMAGE_BYTES = b"\xff\xd8\xff\xe0" + bytes(2048) + b"\xff\xd9"
+AD_PAGE_TEMPLATE = """<!DOCTYPE html><html><head><title>{subject}</title></head><body>
+<div class="page"><div data-name="description-block"><h2>Описание</h2>
+<p>{subject}. Объявление для нагрузочного теста.</p></div>
+<div data-name="seller-block"><h5>Продавец {seller}</h5><p>Объявлений: {count}</p></div>
+</div></body></html>"""
+
+
+class FakeKufar:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        arrival_rate: float = 1.0,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.arrival_rate = arrival_rate
+        self.catalog = {}
+        self.ads = {}
+        self.published_at = {}
+        self.requests = {}
+        self._ad_ids = itertools.count(100000000)
+        self._rng = random.Random(17)
+        self._task = None
+
+    def setup(self, app: web.Application):
+        app.router.add_get(
+            "/search-api/v2/search/rendered-paginated", self.handle_search
+        )
+        app.router.add_get("/search-api/v2/item/{ad_id}/phone", self.handle_phone)
+        app.router.add_get("/item/{ad_id}", self.handle_ad_page)
+        app.router.add_get("/v1/gallery/{path:.*}", self.handle_image)
+        app.router.add_route("HEAD", "/", self.handle_root)
+        app.on_startup.append(self.start_arrivals)
+        app.on_cleanup.append(self.stop_arrivals)
+
+    def count(self, kind: str):
+        self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    async def start_arrivals(self, app: web.Application):
+        self._task = asyncio.create_task(self.publish_forever(app))
+
+    async def stop_arrivals(self, app: web.Application):
+        if self._task:
+            self._task.cancel()
+
+    async def publish_forever(self, app: web.Application):
+        while True:
+            await asyncio.sleep(self._rng.expovariate(self.arrival_rate))
+            # Ads only appear for searches somebody is polling.
+            if self.catalog:
+                self.publish(self._rng.choice(list(self.catalog)), app["base_url"])
+
+    def publish(self, query: str, base_url: str) -> dict:
+        ad_id = next(self._ad_ids)
+        city_name, location = self._rng.choice(REGIONAL_CITIES)
+        price = self._rng.randint(0, 3000) * 100
+        now = time.time()
+        ad = {
+            "ad_id": ad_id,
+            "ad_link": f"{base_url}/item/{ad_id}",
+            "subject": f"{query} #{ad_id}",
+            "list_time": datetime.fromtimestamp(now, timezone.utc).strftime(
+                "%Y-%m-%dT%H:%M:%SZ"
+            ),
+            "price_byn": str(price),
+            "price_usd": str(price * 31 // 100),
+            "images": [
+                {"media_storage": "rms", "path": f"adim1/{ad_id:x}.jpg", "id": "1"}
+            ],
+            "ad_parameters": [
+                {"p": "region", "v": str(location["region"]), "vl": city_name},
+                {"p": "area", "v": "1", "vl": location.get("area", city_name)},
+            ],
+        }
+        catalog = self.catalog.setdefault(query, [])
+        catalog.insert(0, ad)
+        for old_ad in catalog[CATALOG_SIZE:]:
+            self.ads.pop(old_ad["ad_id"], None)
+        del catalog[CATALOG_SIZE:]
+        self.ads[ad_id] = ad
+        self.published_at[ad_id] = now
+        return ad
+
+    async def simulate(self, kind: str) -> web.Response | None:
+        self.count(kind)
+        if self.latency:
+            await asyncio.sleep(self._rng.expovariate(1 / self.latency))
+        roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            self.count("429")
+            return web.json_response(
+                {"error": "Too Many Requests"}, status=429, headers={"Retry-After": "2"}
+            )
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.count("5xx")
+            return web.json_response({"error": "Internal Server Error"}, status=500)
+        return None
+
+    async def handle_root(self, request: web.Request) -> web.Response:
+        return web.Response()
+
+    async def handle_search(self, request: web.Request) -> web.Response:
+        if failure := await self.simulate("search"):
+            return failure
+        query = request.query.get("query", "")
+        if query not in self.catalog:
+            self.catalog[query] = []
+            for _ in range(10):
+                self.publish(query, request.app["base_url"])
+
+        ads = self.catalog[query]
+        if region := request.query.get("rgn"):
+            ads = [ad for ad in ads if ad["ad_parameters"][0]["v"] == region]
+        price_min = int(request.query.get("price_min", 0)) * 100
+        price_max = request.query.get("price_max")
+        ads = [
+            ad
+            for ad in ads
+            if int(ad["price_byn"]) >= price_min
+            and (price_max is None or int(ad["price_byn"]) <= int(price_max) * 100)
+        ]
+
+        size = int(request.query.get("size", 10))
+        offset = int(request.query.get("cursor", 0))
+        pages = [{"label": "self", "num": offset // max(size, 1) + 1, "token": None}]
+        if offset + size < len(ads):
+            pages.append({"label": "next", "token": str(offset + size)})
+        return web.json_response(
+            {
+                "ads": ads[offset : offset + size],
+                "pagination": {"pages": pages},
+                "total": len(ads),
+            }
+        )
+
+    async def handle_ad_page(self, request: web.Request) -> web.Response:
+        if failure := await self.simulate("ad_page"):
+            return failure
+        ad = self.ads.get(int(request.match_info["ad_id"]))
+        if ad is None:
+            raise web.HTTPNotFound()
+        return web.Response(
+            text=AD_PAGE_TEMPLATE.format(
+                subject=ad["subject"],
+                seller=ad["ad_id"] % 1000,
+                count=ad["ad_id"] % 50 + 1,
+            ),
+            content_type="text/html",
+        )
+
+    async def handle_phone(self, request: web.Request) -> web.Response:
+        if failure := await self.simulate("phone"):
+            return failure
+        return web.json_response(
+            {"phone": f"+37529{int(request.match_info['ad_id']) % 10000000:07d}"}
+        )
+
+    async def handle_image(self, request: web.Request) -> web.Response:
+        if failure := await self.simulate("image"):
+            return failure
+        return web.Response(body=IMAGE_BYTES, content_type="image/jpeg")
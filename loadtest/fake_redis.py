@@ -0,0 +1,64 @@
+import argparse
+import asyncio
+
+from src.utils.cluster import MemoryBackend, RedisError, encode_command
+
+
+def encode_reply(reply) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, RedisError):
+        return f"-{reply}\r\n".encode()
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    if isinstance(reply, list):
+        return encode_command(*reply)
+    return encode_command(reply)[len(b"*1\r\n") :]
+
+
+class FakeRedis:
+    # Speaks enough of the Redis protocol for the cluster coordinator, so
+    # several bot nodes can be run against it without a Redis server.
+    def __init__(self):
+        self.backend = MemoryBackend()
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            while line := await reader.readline():
+                args = []
+                for _ in range(int(line[1:])):
+                    length = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(length + 2))[:-2].decode())
+                if args[0].upper() in ("AUTH", "SELECT"):
+                    reply = "OK"
+                else:
+                    reply = self.backend._execute(*args)
+                writer.write(encode_reply(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str, port: int) -> asyncio.Server:
+        return await asyncio.start_server(self.handle_client, host, port)
+
+
+async def serve(args):
+    server = await FakeRedis().start(args.host, args.port)
+    print(f"Заглушка Redis запущена: REDIS_URL=redis://{args.host}:{args.port}/0")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная заглушка Redis")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+
+from aiohttp import web
+
+AD_LINK_RE = re.compile(r"/item/(\d+)")
+
+
+class FakeTelegram:
+    def __init__(self, published_at: dict, latency: float = 0.0):
+        # published_at maps ad_id to its publication time on the fake Kufar,
+        # which gives the publication-to-delivery latency of every message.
+        self.published_at = published_at
+        self.latency = latency
+        self.deliveries = []
+        self.methods = {}
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._rng = random.Random(17)
+
+    def setup(self, app: web.Application):
+        app.router.add_post("/bot{token}/{method}", self.handle_method)
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.methods[method] = self.methods.get(method, 0) + 1
+        data = await request.post()
+        if self.latency:
+            await asyncio.sleep(self._rng.expovariate(1 / self.latency))
+
+        if method == "getUpdates":
+            await asyncio.sleep(min(float(data.get("timeout", 0)), 10))
+            return self.ok([])
+        if method == "getMe":
+            return self.ok(
+                {"id": 1, "is_bot": True, "first_name": "Stand-in", "username": "bot"}
+            )
+        if method in ("sendMessage", "sendPhoto"):
+            return self.ok(self.record(method, data))
+        if method == "sendMediaGroup":
+            return self.ok(self.record_album(data))
+        return self.ok(True)
+
+    def ok(self, result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    def record_deliveries(self, chat_id: int, text: str):
+        # A digest carries several ads, each is counted as delivered.
+        for ad_id in dict.fromkeys(map(int, AD_LINK_RE.findall(text))):
+            if ad_id in self.published_at:
+                self.deliveries.append(
+                    (chat_id, ad_id, time.time() - self.published_at[ad_id])
+                )
+
+    def record(self, method: str, data) -> dict:
+        chat_id = int(data["chat_id"])
+        self.record_deliveries(chat_id, data.get("reply_markup", ""))
+        return self.make_message(method, chat_id, data)
+
+    def record_album(self, data) -> list:
+        chat_id = int(data["chat_id"])
+        media = json.loads(data["media"])
+        self.record_deliveries(
+            chat_id, " ".join(item.get("caption", "") for item in media)
+        )
+        return [self.make_message("sendPhoto", chat_id, item) for item in media]
+
+    def make_message(self, method: str, chat_id: int, data) -> dict:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        if method == "sendPhoto":
+            file_id = f"stand-in-{next(self._file_ids)}"
+            message["photo"] = [
+                {
+                    "file_id": file_id,
+                    "file_unique_id": file_id,
+                    "width": 640,
+                    "height": 480,
+                }
+            ]
+            message["caption"] = data.get("caption", "")
+        else:
+            message["text"] = data.get("text", "")
+        return message
@@ -0,0 +1,138 @@
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+
+from loadtest.server import add_server_arguments, start_stand_in
+
+
+def percentile(sorted_values: list, percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = round(percent / 100 * (len(sorted_values) - 1))
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def print_report(args, fake_kufar, fake_telegram, elapsed: float):
+    latencies = sorted(latency for _, _, latency in fake_telegram.deliveries)
+    print(
+        f"Пользователей: {args.users}, запросов на пользователя: {args.queries}, "
+        f"длительность: {elapsed:.0f} сек."
+    )
+    print(
+        "Запросы к Kufar: "
+        + ", ".join(f"{kind} {count}" for kind, count in fake_kufar.requests.items())
+    )
+    print(
+        f"Поисковых запросов в секунду: {fake_kufar.requests.get('search', 0) / elapsed:.2f}"
+    )
+    print(f"Опубликовано объявлений: {len(fake_kufar.published_at)}")
+    print(
+        f"Доставлено уведомлений: {len(latencies)} "
+        f"({len(latencies) / elapsed:.2f} в секунду)"
+    )
+    send_methods = ("sendMessage", "sendPhoto", "sendMediaGroup")
+    print(
+        "Вызовы Telegram API: "
+        + ", ".join(
+            f"{method} {fake_telegram.methods.get(method, 0)}"
+            for method in send_methods
+        )
+    )
+    if latencies:
+        print(
+            "Задержка от публикации до доставки, сек.: "
+            f"p50 {percentile(latencies, 50):.2f}, "
+            f"p90 {percentile(latencies, 90):.2f}, "
+            f"p99 {percentile(latencies, 99):.2f}, "
+            f"макс. {latencies[-1]:.2f}"
+        )
+
+
+async def run_load_test(args):
+    # The bot reads its configuration on import, so it is imported only after
+    # STAND_IN_URL points at the stand-in.
+    from src import config
+    from src.bot import create_bot, create_cluster
+    from src.poller import Poller
+    from src.polling_workers import WorkerPool
+    from src.utils import data_manager
+    from src.utils.kufar_cities import CITIES
+    from src.utils.kufar_client import create_kufar_client
+
+    runner, fake_kufar, fake_telegram = await start_stand_in(args)
+
+    rng = random.Random(args.seed)
+    texts = [f"товар {index}" for index in range(args.texts)]
+    for user_id in range(1, args.users + 1):
+        data_manager.add_user(user_id)
+        data_manager.update_user_settings(
+            user_id, {"delivery_mode": args.delivery_mode}
+        )
+        for _ in range(args.queries):
+            data_manager.add_query(
+                user_id, {"query": rng.choice(texts), "city": rng.choice(CITIES)}
+            )
+
+    config.TELEGRAM_BOT_TOKEN = "123456:stand-in"
+    bot = create_bot()
+    kufar_client = create_kufar_client()
+    await kufar_client.start()
+
+    start_time = time.monotonic()
+    if args.workers:
+        poller = WorkerPool(bot, kufar_client, args.workers)
+    else:
+        poller = Poller(bot, kufar_client, create_cluster())
+    polling = asyncio.create_task(poller.run())
+    try:
+        await asyncio.wait_for(asyncio.shield(polling), args.duration)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        polling.cancel()
+        await asyncio.gather(polling, return_exceptions=True)
+        elapsed = time.monotonic() - start_time
+        await kufar_client.close()
+        await bot.session.close()
+        await runner.cleanup()
+
+    print_report(args, fake_kufar, fake_telegram, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Нагрузочный тест бота на локальных заглушках Kufar и Telegram"
+    )
+    add_server_arguments(parser)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument(
+        "--queries", type=int, default=5, help="запросов на пользователя"
+    )
+    parser.add_argument("--texts", type=int, default=100, help="разных поисковых фраз")
+    parser.add_argument("--duration", type=float, default=60, help="сек.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--workers", type=int, default=0, help="процессов опроса (POLLING_WORKERS)"
+    )
+    parser.add_argument(
+        "--delivery-mode",
+        choices=("single", "album", "list"),
+        default="single",
+        help="режим доставки у всех пользователей",
+    )
+    args = parser.parse_args()
+
+    os.environ["STAND_IN_URL"] = f"http://{args.host}:{args.port}"
+    logging.basicConfig(level=logging.WARNING)
+    # Users, queries and the seen-ad cache are written to a throwaway directory.
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        asyncio.run(run_load_test(args))
+
+
+if __name__ == "__main__":
+    main()
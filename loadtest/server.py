@@ -0,0 +1,73 @@
+import argparse
+import asyncio
+
+from aiohttp import web
+
+from loadtest.fake_kufar import FakeKufar
+from loadtest.fake_telegram import FakeTelegram
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="средняя задержка Kufar, сек."
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="доля ответов 500"
+    )
+    parser.add_argument(
+        "--rate-limit-rate", type=float, default=0.0, help="доля ответов 429"
+    )
+    parser.add_argument(
+        "--arrival-rate",
+        type=float,
+        default=1.0,
+        help="новых объявлений в секунду на все запросы",
+    )
+    parser.add_argument(
+        "--telegram-latency",
+        type=float,
+        default=0.02,
+        help="средняя задержка Telegram, сек.",
+    )
+
+
+async def start_stand_in(args) -> tuple[web.AppRunner, FakeKufar, FakeTelegram]:
+    fake_kufar = FakeKufar(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        arrival_rate=args.arrival_rate,
+    )
+    fake_telegram = FakeTelegram(fake_kufar.published_at, args.telegram_latency)
+    app = web.Application()
+    app["base_url"] = f"http://{args.host}:{args.port}"
+    fake_kufar.setup(app)
+    fake_telegram.setup(app)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, args.host, args.port).start()
+    return runner, fake_kufar, fake_telegram
+
+
+async def serve(args):
+    runner, _, _ = await start_stand_in(args)
+    print(
+        f"Заглушки Kufar и Telegram запущены: STAND_IN_URL=http://{args.host}:{args.port}"
+    )
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальные заглушки Kufar и Telegram")
+    add_server_arguments(parser)
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
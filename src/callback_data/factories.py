@@ -2,12 +2,12 @@ from aiogram.filters.callback_data import CallbackData
 
 
 class QueryCallbackFactory(CallbackData, prefix="query"):
-    query_index: int
+    query_id: int
 
 
 class QueryActionCallbackFactory(CallbackData, prefix="query_action"):
     action: str
-    query_index: int
+    query_id: int
 
 
 class CityCallbackFactory(CallbackData, prefix="city"):
@@ -1,4 +1,5 @@
 import os
+import socket
 
 from dotenv import load_dotenv
 
@@ -11,15 +12,117 @@ ADMIN_IDS = [
     int(admin_id.strip()) for admin_id in ADMIN_IDS_STR.split(",") if admin_id.strip()
 ]
 
+# "json" - plain JSON files (default), "sqlite" - single SQLite database in WAL mode.
+# On the first start with "sqlite" existing JSON data is migrated automatically.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").lower()
+SQLITE_DB_FILE = "data/bot.sqlite3"
 USERS_FILE = "data/users.json"
+USER_SETTINGS_FILE = "data/user_settings.json"
 QUERIES_FILE = "data/queries.json"
 CACHED_ADS_FILE = "data/cached_ads.json"
+WATERMARKS_FILE = "data/watermarks.json"
+# Seen ad IDs are forgotten after this many days without showing up in results,
+# and the store never holds more than SEEN_ADS_MAX_SIZE IDs (oldest go first).
+SEEN_ADS_TTL_DAYS = int(os.getenv("SEEN_ADS_TTL_DAYS", 14))
+SEEN_ADS_MAX_SIZE = int(os.getenv("SEEN_ADS_MAX_SIZE", 200000))
+# How already sent ads are recognised. "seen_ads" (default) keeps every sent ID
+# in the store above. "watermark" keeps only the newest list_time per search
+# with the IDs published at that time and treats everything above it as new:
+# the state no longer grows with the number of ads, but an ad raised to the
+# top by its seller is sent again.
+DEDUP_MODE = os.getenv("DEDUP_MODE", "seen_ads").lower()
 
-# You can adjust the delay between queries in seconds, if you need.
-DELAY_BETWEEN_QUERIES = int(os.getenv("DELAY_BETWEEN_QUERIES", 1))
+# Load testing: when set, all Kufar and Telegram Bot API traffic goes to this
+# local stand-in (python -m loadtest.server) instead of the real services.
+STAND_IN_URL = os.getenv("STAND_IN_URL")
+KUFAR_API_BASE_URL = STAND_IN_URL or "https://api.kufar.by"
+KUFAR_WEB_BASE_URL = STAND_IN_URL or "https://www.kufar.by"
+KUFAR_MEDIA_BASE_URL = STAND_IN_URL or "https://rms.kufar.by"
+TELEGRAM_API_URL = STAND_IN_URL
+
+# One HTTP session is shared by all Kufar traffic (search, ad pages, photos):
+# pooled connections, timeouts in seconds, and how long an idle kept-alive
+# connection may be reused.
+KUFAR_MAX_CONNECTIONS = int(os.getenv("KUFAR_MAX_CONNECTIONS", 10))
+KUFAR_CONNECT_TIMEOUT = float(os.getenv("KUFAR_CONNECT_TIMEOUT", 5))
+KUFAR_REQUEST_TIMEOUT = float(os.getenv("KUFAR_REQUEST_TIMEOUT", 20))
+KUFAR_CONNECTION_MAX_IDLE = int(os.getenv("KUFAR_CONNECTION_MAX_IDLE", 300))
+# Number of separate processes that poll Kufar and parse ad pages; searches are
+# split between them by a stable hash. 0 keeps everything in the bot process.
+POLLING_WORKERS = int(os.getenv("POLLING_WORKERS", 0))
+# How many Kufar search requests may run at the same time.
+POLLING_CONCURRENCY = int(os.getenv("POLLING_CONCURRENCY", 5))
+# Cap on Kufar requests per second shared by searches, ad pages and phone
+# numbers. The actual rate adapts: it is halved whenever Kufar answers 429, 5xx
+# or times out (waiting out Retry-After) and creeps back up on success, never
+# below KUFAR_MIN_REQUESTS_PER_SECOND. After KUFAR_CIRCUIT_FAILURES failures in
+# a row a request kind is paused for KUFAR_CIRCUIT_COOLDOWN seconds.
+KUFAR_REQUESTS_PER_SECOND = float(os.getenv("KUFAR_REQUESTS_PER_SECOND", 4))
+KUFAR_MIN_REQUESTS_PER_SECOND = float(os.getenv("KUFAR_MIN_REQUESTS_PER_SECOND", 0.2))
+KUFAR_CIRCUIT_FAILURES = int(os.getenv("KUFAR_CIRCUIT_FAILURES", 5))
+KUFAR_CIRCUIT_COOLDOWN = float(os.getenv("KUFAR_CIRCUIT_COOLDOWN", 60))
 DELAY_MAIN_LOOP = int(
     os.getenv("DELAY_MAIN_LOOP", 30)
-)  # seconds before the next parsing attempt
+)  # initial per-query polling interval and period of queries reload / cache save
+# Bounds (seconds) for the adaptive per-query polling interval: queries that keep
+# producing new ads are polled more often, quiet ones back off up to the maximum.
+POLL_INTERVAL_MIN = int(os.getenv("POLL_INTERVAL_MIN", 10))
+POLL_INTERVAL_MAX = int(os.getenv("POLL_INTERVAL_MAX", 300))
+# Search results are read page by page until the newest ad from the previous
+# check is reached, at most KUFAR_MAX_PAGES pages per check. The page size adapts
+# per query between the bounds: it grows while new ads arrive in bursts and
+# shrinks back for quiet queries.
+KUFAR_MAX_PAGES = int(os.getenv("KUFAR_MAX_PAGES", 5))
+KUFAR_PAGE_SIZE_MIN = int(os.getenv("KUFAR_PAGE_SIZE_MIN", 5))
+KUFAR_PAGE_SIZE_MAX = int(os.getenv("KUFAR_PAGE_SIZE_MAX", 50))
+# Kufar publication-to-discovery delay (seconds) above which a warning is logged.
+API_DELAY_WARNING_THRESHOLD = int(os.getenv("API_DELAY_WARNING_THRESHOLD", 240))
+
+# Ad page enrichment (description, seller, phone): parallel page loads, per-ad
+# timeout in seconds after which the ad is sent without details, and a cache.
+ENRICHMENT_CONCURRENCY = int(os.getenv("ENRICHMENT_CONCURRENCY", 4))
+ENRICHMENT_TIMEOUT = float(os.getenv("ENRICHMENT_TIMEOUT", 10))
+ENRICHMENT_CACHE_SIZE = int(os.getenv("ENRICHMENT_CACHE_SIZE", 1000))
+ENRICHMENT_CACHE_TTL = int(os.getenv("ENRICHMENT_CACHE_TTL", 3600))
+
+# Outbound Telegram notifications are sent from a queue by DELIVERY_WORKERS
+# workers within Telegram limits: messages per second for the whole bot and per
+# chat (with a short burst allowance). Transient errors are retried.
+DELIVERY_WORKERS = int(os.getenv("DELIVERY_WORKERS", 4))
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 25))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", 1))
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", 3))
+DELIVERY_MAX_ATTEMPTS = int(os.getenv("DELIVERY_MAX_ATTEMPTS", 5))
+# On shutdown the queue keeps sending for at most this many seconds.
+DELIVERY_DRAIN_TIMEOUT = float(os.getenv("DELIVERY_DRAIN_TIMEOUT", 10))
+# Users can switch their notifications to a digest in the query settings: ads
+# found for them within DIGEST_WINDOW seconds are sent together as a photo
+# album or as one compact list, at most DIGEST_MAX_ADS ads per batch.
+DIGEST_WINDOW = float(os.getenv("DIGEST_WINDOW", 60))
+DIGEST_MAX_ADS = int(os.getenv("DIGEST_MAX_ADS", 10))
+# How many recently uploaded ad photos keep their Telegram file_id for reuse.
+MEDIA_CACHE_SIZE = int(os.getenv("MEDIA_CACHE_SIZE", 500))
+
+# Prometheus metrics are served on http://METRICS_HOST:METRICS_PORT/metrics;
+# port 0 turns the endpoint off.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+
+# Several bot instances can share the polling load: "redis" keeps seen ads and
+# search ownership in the Redis server at REDIS_URL, "memory" is an in-process
+# stand-in for tests, empty runs a single instance. Every search is leased by
+# one live node for CLUSTER_LEASE_TTL seconds and moves to another node when
+# its owner stops renewing, resuming from the position the owner shared in the
+# cluster backend. Users and queries are read from STORAGE_BACKEND=sqlite, so
+# all nodes run on one host with the database on a local disk: SQLite locking
+# does not work over network filesystems. Only one node may receive Telegram
+# updates; the others run with NODE_ROLE=poller.
+CLUSTER_BACKEND = os.getenv("CLUSTER_BACKEND", "").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CLUSTER_KEY_PREFIX = os.getenv("CLUSTER_KEY_PREFIX", "kufar-bot")
+CLUSTER_LEASE_TTL = float(os.getenv("CLUSTER_LEASE_TTL", 30))
+NODE_ID = os.getenv("NODE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+NODE_ROLE = os.getenv("NODE_ROLE", "full").lower()
 
 # "WARNING" - silent mode, only errors and important warnings.
 # "DEBUG" - detailed mode for debugging with all timers.
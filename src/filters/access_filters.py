@@ -12,4 +12,4 @@ class IsAdmin(BaseFilter):
 
 class IsUser(BaseFilter):
     async def __call__(self, message: Message) -> bool:
-        return message.from_user.id in data_manager.load_users()
+        return data_manager.is_user(message.from_user.id)
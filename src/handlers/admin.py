@@ -24,10 +24,7 @@ async def send_admin_help(message: Message):
 async def add_user(message: Message, command: CommandObject):
     try:
         user_id = int(command.args)
-        users = data_manager.load_users()
-        if user_id not in users:
-            users.append(user_id)
-            data_manager.save_users(users)
+        if data_manager.add_user(user_id):
             await message.answer(f"Пользователь {user_id} добавлен.")
         else:
             await message.answer(f"Пользователь {user_id} уже существует.")
@@ -39,10 +36,7 @@ async def add_user(message: Message, command: CommandObject):
 async def del_user(message: Message, command: CommandObject):
     try:
         user_id = int(command.args)
-        users = data_manager.load_users()
-        if user_id in users:
-            users.remove(user_id)
-            data_manager.save_users(users)
+        if data_manager.remove_user(user_id):
             await message.answer(f"Пользователь {user_id} удален.")
         else:
             await message.answer(f"Пользователь {user_id} не найден.")
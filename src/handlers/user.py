@@ -1,11 +1,8 @@
-import logging
-
 from aiogram import F, Router
 from aiogram.enums import ParseMode
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message
-from curl_cffi.requests import AsyncSession
 
 from src.callback_data.factories import (
     CityCallbackFactory,
@@ -15,11 +12,17 @@ from src.callback_data.factories import (
 from src.keyboards import inline as keyboards
 from src.keyboards import reply as reply_keyboards
 from src.states.query_states import AddQuery, QuerySettings
-from src.utils import data_manager, kufar_api
+from src.utils import data_manager, digest
 
 router = Router()
 
 
+def get_delivery_mode(user_id: int) -> str:
+    return data_manager.get_user_settings(user_id).get(
+        "delivery_mode", digest.DEFAULT_DELIVERY_MODE
+    )
+
+
 @router.message(Command("start"))
 async def cmd_start(message: Message, state: FSMContext):
     await state.clear()
@@ -47,8 +50,7 @@ async def back_to_main_menu(callback: CallbackQuery, state: FSMContext):
 
 @router.callback_query(F.data == "my_queries")
 async def my_queries_callback(callback: CallbackQuery):
-    user_id = str(callback.from_user.id)
-    user_queries = data_manager.load_queries().get(user_id, [])
+    user_queries = data_manager.get_user_queries(callback.from_user.id)
     if not user_queries:
         await callback.answer(
             "У вас еще нет запросов. Сначала добавьте один.", show_alert=True
@@ -78,7 +80,9 @@ async def process_add_query_text(message: Message, state: FSMContext):
 
 @router.callback_query(AddQuery.waiting_for_city, CityCallbackFactory.filter())
 async def process_add_query_city(
-    callback: CallbackQuery, callback_data: CityCallbackFactory, state: FSMContext
+    callback: CallbackQuery,
+    callback_data: CityCallbackFactory,
+    state: FSMContext,
 ):
     data = await state.get_data()
     query_text = data["query_text"]
@@ -86,27 +90,7 @@ async def process_add_query_city(
 
     query_data = {"query": query_text, "city": city_name}
 
-    logging.info(f"Добавлен новый запрос {query_data}. Прогреваем для него кеш...")
-    try:
-        async with AsyncSession() as session:
-            initial_ads = await kufar_api.get_new_ads(session, query_data)
-            if initial_ads:
-                initial_ids = {ad.get("ad_id") for ad in initial_ads if ad.get("ad_id")}
-                cached_ads = data_manager.load_cached_ads()
-                cached_ads.update(initial_ids)
-                data_manager.save_cached_ads(cached_ads)
-                logging.info(
-                    f"Кеш для нового запроса прогрет. Добавлено {len(initial_ids)} ID."
-                )
-    except Exception as e:
-        logging.error(f"Не удалось прогреть кеш для нового запроса: {e}")
-
-    user_id = str(callback.from_user.id)
-    all_queries = data_manager.load_queries()
-    user_queries = all_queries.get(user_id, [])
-    user_queries.append(query_data)
-    all_queries[user_id] = user_queries
-    data_manager.save_queries(all_queries)
+    data_manager.add_query(callback.from_user.id, query_data)
 
     await state.clear()
     await callback.message.delete()
@@ -118,16 +102,16 @@ async def process_add_query_city(
 
 @router.callback_query(QueryCallbackFactory.filter())
 async def manage_query(callback: CallbackQuery, callback_data: QueryCallbackFactory):
-    q_index = callback_data.query_index
-    user_id = str(callback.from_user.id)
-    user_queries = data_manager.load_queries().get(user_id, [])
-    if 0 <= q_index < len(user_queries):
-        query = user_queries[q_index]
-        text = keyboards.format_query_details(query)
+    query_id = callback_data.query_id
+    query = data_manager.get_query(callback.from_user.id, query_id)
+    if query:
+        text = keyboards.format_query_details(
+            query, get_delivery_mode(callback.from_user.id)
+        )
         await callback.message.edit_text(
             text,
             parse_mode=ParseMode.HTML,
-            reply_markup=keyboards.create_manage_query_keyboard(q_index),
+            reply_markup=keyboards.create_manage_query_keyboard(query_id),
         )
     else:
         await callback.answer("Запрос не найден.", show_alert=True)
@@ -138,16 +122,8 @@ async def manage_query(callback: CallbackQuery, callback_data: QueryCallbackFact
 async def delete_query_action(
     callback: CallbackQuery, callback_data: QueryActionCallbackFactory
 ):
-    q_index = callback_data.query_index
-    user_id = str(callback.from_user.id)
-    all_queries = data_manager.load_queries()
-    user_queries = all_queries.get(user_id, [])
-    if 0 <= q_index < len(user_queries):
-        removed = user_queries.pop(q_index)
-        all_queries[user_id] = user_queries
-        if not user_queries:
-            del all_queries[user_id]
-        data_manager.save_queries(all_queries)
+    removed = data_manager.delete_query(callback.from_user.id, callback_data.query_id)
+    if removed:
         await callback.answer(f"Запрос «{removed['query']}» удален.")
         await my_queries_callback(callback)
     else:
@@ -158,22 +134,31 @@ async def delete_query_action(
 async def toggle_search_action(
     callback: CallbackQuery, callback_data: QueryActionCallbackFactory
 ):
-    q_index = callback_data.query_index
-    user_id = str(callback.from_user.id)
-    all_queries = data_manager.load_queries()
-    user_queries = all_queries.get(user_id, [])
-    if 0 <= q_index < len(user_queries):
-        user_queries[q_index]["only_title_search"] = not user_queries[q_index].get(
-            "only_title_search", False
+    user_id, query_id = callback.from_user.id, callback_data.query_id
+    query = data_manager.get_query(user_id, query_id)
+    if query:
+        data_manager.update_query(
+            user_id,
+            query_id,
+            {"only_title_search": not query.get("only_title_search", False)},
         )
-        all_queries[user_id] = user_queries
-        data_manager.save_queries(all_queries)
         await callback.answer("Настройка поиска в заголовках изменена.")
-        await manage_query(callback, QueryCallbackFactory(query_index=q_index))
+        await manage_query(callback, QueryCallbackFactory(query_id=query_id))
     else:
         await callback.answer("Запрос не найден.", show_alert=True)
 
 
+@router.callback_query(QueryActionCallbackFactory.filter(F.action == "toggle_delivery"))
+async def toggle_delivery_action(
+    callback: CallbackQuery, callback_data: QueryActionCallbackFactory
+):
+    user_id = callback.from_user.id
+    mode = digest.get_next_mode(get_delivery_mode(user_id))
+    data_manager.update_user_settings(user_id, {"delivery_mode": mode})
+    await callback.answer(f"Режим доставки: {digest.DELIVERY_MODES[mode]}.")
+    await manage_query(callback, QueryCallbackFactory(query_id=callback_data.query_id))
+
+
 @router.callback_query(
     QueryActionCallbackFactory.filter(
         F.action.in_({"set_price", "set_limit", "set_city"})
@@ -184,9 +169,9 @@ async def set_parameter_action(
     callback_data: QueryActionCallbackFactory,
     state: FSMContext,
 ):
-    action, q_index = callback_data.action, callback_data.query_index
+    action, query_id = callback_data.action, callback_data.query_id
     await state.update_data(
-        query_index=q_index, original_message_id=callback.message.message_id
+        query_id=query_id, original_message_id=callback.message.message_id
     )
     if action == "set_price":
         await state.set_state(QuerySettings.waiting_for_price)
@@ -211,53 +196,47 @@ async def process_edit_query_city(
     callback: CallbackQuery, callback_data: CityCallbackFactory, state: FSMContext
 ):
     data = await state.get_data()
-    q_index = data["query_index"]
+    query_id = data["query_id"]
     city_name = callback_data.city_name
 
-    user_id = str(callback.from_user.id)
-    all_queries = data_manager.load_queries()
-    user_queries = all_queries.get(user_id, [])
-
-    if 0 <= q_index < len(user_queries):
-        user_queries[q_index]["city"] = city_name
-        all_queries[user_id] = user_queries
-        data_manager.save_queries(all_queries)
+    if data_manager.update_query(callback.from_user.id, query_id, {"city": city_name}):
         await callback.answer(f"Город изменен на «{city_name}».")
 
     await state.clear()
-    await manage_query(callback, QueryCallbackFactory(query_index=q_index))
+    await manage_query(callback, QueryCallbackFactory(query_id=query_id))
 
 
 @router.message(QuerySettings.waiting_for_price)
 async def process_price(message: Message, state: FSMContext):
     data = await state.get_data()
-    q_index, original_message_id = data["query_index"], data["original_message_id"]
+    query_id, original_message_id = data["query_id"], data["original_message_id"]
     try:
         min_price, max_price = map(int, message.text.split())
-        user_id = str(message.from_user.id)
-        all_queries = data_manager.load_queries()
-        user_queries = all_queries.get(user_id, [])
-        if 0 <= q_index < len(user_queries):
-            if min_price == 0 and max_price == 0:
-                user_queries[q_index].pop("price_min", None)
-                user_queries[q_index].pop("price_max", None)
-            else:
-                (
-                    user_queries[q_index]["price_min"],
-                    user_queries[q_index]["price_max"],
-                ) = min_price, max_price
-            all_queries[user_id] = user_queries
-            data_manager.save_queries(all_queries)
+        if min_price == 0 and max_price == 0:
+            query = data_manager.update_query(
+                message.from_user.id,
+                query_id,
+                {},
+                removed_keys=("price_min", "price_max"),
+            )
+        else:
+            query = data_manager.update_query(
+                message.from_user.id,
+                query_id,
+                {"price_min": min_price, "price_max": max_price},
+            )
+        if query:
             await message.delete()
             await state.clear()
-            query = user_queries[q_index]
-            text = keyboards.format_query_details(query)
+            text = keyboards.format_query_details(
+                query, get_delivery_mode(message.from_user.id)
+            )
             await message.bot.edit_message_text(
                 text,
                 chat_id=message.chat.id,
                 message_id=original_message_id,
                 parse_mode=ParseMode.HTML,
-                reply_markup=keyboards.create_manage_query_keyboard(q_index),
+                reply_markup=keyboards.create_manage_query_keyboard(query_id),
             )
     except ValueError:
         await message.answer("Неверный формат. Введите два числа через пробел.")
@@ -266,26 +245,24 @@ async def process_price(message: Message, state: FSMContext):
 @router.message(QuerySettings.waiting_for_limit)
 async def process_limit(message: Message, state: FSMContext):
     data = await state.get_data()
-    q_index, original_message_id = data["query_index"], data["original_message_id"]
+    query_id, original_message_id = data["query_id"], data["original_message_id"]
     try:
         limit = int(message.text)
-        user_id = str(message.from_user.id)
-        all_queries = data_manager.load_queries()
-        user_queries = all_queries.get(user_id, [])
-        if 0 <= q_index < len(user_queries):
-            user_queries[q_index]["limit"] = limit
-            all_queries[user_id] = user_queries
-            data_manager.save_queries(all_queries)
+        query = data_manager.update_query(
+            message.from_user.id, query_id, {"limit": limit}
+        )
+        if query:
             await message.delete()
             await state.clear()
-            query = user_queries[q_index]
-            text = keyboards.format_query_details(query)
+            text = keyboards.format_query_details(
+                query, get_delivery_mode(message.from_user.id)
+            )
             await message.bot.edit_message_text(
                 text,
                 chat_id=message.chat.id,
                 message_id=original_message_id,
                 parse_mode=ParseMode.HTML,
-                reply_markup=keyboards.create_manage_query_keyboard(q_index),
+                reply_markup=keyboards.create_manage_query_keyboard(query_id),
             )
     except ValueError:
         await message.answer("Неверный формат. Введите одно число.")
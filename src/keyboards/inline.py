@@ -5,6 +5,7 @@ from src.callback_data.factories import (
     QueryActionCallbackFactory,
     QueryCallbackFactory,
 )
+from src.utils.digest import DEFAULT_DELIVERY_MODE, DELIVERY_MODES
 from src.utils.kufar_cities import CITIES
 
 
@@ -18,10 +19,10 @@ def create_main_menu_keyboard():
 
 def create_queries_keyboard(user_queries: list):
     builder = InlineKeyboardBuilder()
-    for i, query in enumerate(user_queries):
+    for query in user_queries:
         builder.button(
             text=f"⚙️ {query.get('query')}",
-            callback_data=QueryCallbackFactory(query_index=i),
+            callback_data=QueryCallbackFactory(query_id=query["id"]),
         )
     builder.button(text="« Назад в меню", callback_data="main_menu")
     builder.adjust(1)
@@ -36,7 +37,9 @@ def create_city_selection_keyboard():
     return builder.as_markup()
 
 
-def format_query_details(query: dict) -> str:
+def format_query_details(
+    query: dict, delivery_mode: str = DEFAULT_DELIVERY_MODE
+) -> str:
     details = [f'<b>Запрос:</b> "{query.get("query")}"']
 
     city_name = query.get("city", "Все города")
@@ -49,27 +52,30 @@ def format_query_details(query: dict) -> str:
         details.append(f"<b>Лимит:</b> {query.get('limit')} объявлений")
     if query.get("only_title_search"):
         details.append("<b>Поиск:</b> только в заголовках")
+    if delivery_mode != DEFAULT_DELIVERY_MODE:
+        details.append(
+            f"<b>Доставка:</b> {DELIVERY_MODES[delivery_mode]} (для всех запросов)"
+        )
     return "\n".join(details)
 
 
-def create_manage_query_keyboard(query_index: int):
+def create_manage_query_keyboard(query_id: int):
     builder = InlineKeyboardBuilder()
     actions = {
         "Установить цену": "set_price",
         "Установить лимит": "set_limit",
         "🏙️ Изменить город": "set_city",
         "Поиск в заголовках": "toggle_search",
+        "📦 Режим доставки": "toggle_delivery",
         "❌ Удалить запрос": "delete_query",
     }
     for text, action in actions.items():
         builder.button(
             text=text,
-            callback_data=QueryActionCallbackFactory(
-                action=action, query_index=query_index
-            ),
+            callback_data=QueryActionCallbackFactory(action=action, query_id=query_id),
         )
     builder.button(text="« Назад к списку", callback_data="my_queries")
-    builder.adjust(2, 1, 1, 1)
+    builder.adjust(2, 1, 2, 1, 1)
     return builder.as_markup()
 
 
@@ -77,3 +83,11 @@ def create_ad_link_keyboard(url: str):
     builder = InlineKeyboardBuilder()
     builder.button(text="🔗 Смотреть на Kufar", url=url)
     return builder.as_markup()
+
+
+def create_ad_links_keyboard(urls: list):
+    builder = InlineKeyboardBuilder()
+    for number, url in enumerate(urls, 1):
+        builder.button(text=f"🔗 {number}", url=url)
+    builder.adjust(5)
+    return builder.as_markup()
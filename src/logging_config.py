@@ -5,7 +5,7 @@ from logging.handlers import TimedRotatingFileHandler
 from src import config
 
 
-def setup_logging():
+def setup_logging(tag: str = ""):
     os.makedirs("logs", exist_ok=True)
 
     log_level_str = config.LOG_LEVEL.upper()
@@ -18,11 +18,14 @@ def setup_logging():
 
     root_logger.setLevel(log_level)
 
+    # Polling workers write to the same files; the tag tells their lines apart.
+    tag = f" [{tag}]" if tag else ""
     info_formatter = logging.Formatter(
-        "[%(asctime)s] [%(levelname)s] - %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
+        f"[%(asctime)s] [%(levelname)s]{tag} - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
     )
     debug_formatter = logging.Formatter(
-        "[%(asctime)s] [%(levelname)s] [%(name)s] - %(message)s",
+        f"[%(asctime)s] [%(levelname)s] [%(name)s]{tag} - %(message)s",
         datefmt="%Y-%m-%d %H:%M:%S",
     )
 
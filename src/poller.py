@@ -0,0 +1,789 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+
+from aiogram import Bot
+
+from src import config
+from src.keyboards import inline as keyboards
+from src.utils import data_manager, kufar_api, metrics, planner
+from src.utils.ad import Ad
+from src.utils.cluster import ClusterCoordinator
+from src.utils.delivery import DeliveryQueue, Notification
+from src.utils.digest import DEFAULT_DELIVERY_MODE, DigestBatcher, split_batch
+from src.utils.enrichment import Enricher
+from src.utils.kufar_client import KufarClient
+from src.utils.media_cache import MediaCache
+from src.utils.scheduler import QueryScheduler
+from src.utils.seen_ads import SeenAdStore
+from src.utils.watermarks import WatermarkStore
+
+
+class FetchStats:
+    def __init__(self):
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.busy_time = 0.0
+        self.requests_count = 0
+
+
+# Even an unchanged result is fully processed this often, which keeps the
+# ads on it fresh in the seen-ad store.
+FINGERPRINT_MAX_AGE = 60 * 60
+# With watermark dedup only recently notified IDs are kept, in memory: they
+# stop an ad found by several searches at once from being sent twice.
+RECENT_ADS_TTL = 24 * 60 * 60
+RECENT_ADS_MAX_SIZE = 5000
+
+
+def get_fingerprint(ads: list) -> int:
+    return hash(tuple((ad.id, ad.list_time) for ad in ads))
+
+
+class SearchState:
+    def __init__(self, page_size: int):
+        self.page_size = page_size
+        self.newest_time = None
+        self.newest_ids = []
+        # Set once the search has a starting position: from the warm-up, an
+        # earlier check or a saved watermark.
+        self.warmed_up = False
+        self.fingerprint = None
+        self.fingerprint_members = None
+        self.fingerprint_time = 0.0
+        self.conditional_headers = {}
+
+    def can_skip(self, member_keys: list) -> bool:
+        # A changed set of subscriptions must see the result at least once.
+        return (
+            self.fingerprint is not None
+            and self.fingerprint_members == frozenset(member_keys)
+            and time.monotonic() - self.fingerprint_time < FINGERPRINT_MAX_AGE
+        )
+
+    def is_unchanged(self, member_keys: list, ads: list) -> bool:
+        fingerprint = get_fingerprint(ads)
+        if fingerprint == self.fingerprint and self.can_skip(member_keys):
+            return True
+        self.fingerprint = fingerprint
+        self.fingerprint_members = frozenset(member_keys)
+        self.fingerprint_time = time.monotonic()
+        return False
+
+    def restore(self, list_time: str, ad_ids: list):
+        self.newest_time = datetime.fromisoformat(list_time)
+        self.newest_ids = list(ad_ids)
+        self.warmed_up = True
+
+    def watermark(self) -> tuple[str, list] | None:
+        if self.newest_time is None:
+            return None
+        return self.newest_time.isoformat(), self.newest_ids
+
+    def is_above(self, ad_time: datetime, ad_id) -> bool:
+        if self.newest_time is None or ad_time > self.newest_time:
+            return True
+        return ad_time == self.newest_time and ad_id not in self.newest_ids
+
+    def select_new(self, ads: list) -> list:
+        return [
+            ad
+            for ad in ads
+            if ad.timestamp is not None and self.is_above(ad.timestamp, ad.id)
+        ]
+
+    def reaches_known(self, ads: list) -> bool:
+        # Results are sorted by list_time, so a page holding an ad that is not
+        # newer than the previous check joins the already read results.
+        for ad in ads:
+            if ad.timestamp is None or ad.timestamp <= self.newest_time:
+                return True
+        return False
+
+    def observe(self, ads: list) -> int:
+        newest_time = self.newest_time
+        newest_ids = self.newest_ids
+        new_ads_count = 0
+        for ad in ads:
+            ad_time = ad.timestamp
+            if ad_time is None or not self.is_above(ad_time, ad.id):
+                continue
+            new_ads_count += 1
+            if newest_time is None or ad_time > newest_time:
+                newest_time = ad_time
+                newest_ids = [ad.id]
+            elif ad_time == newest_time and ad.id not in newest_ids:
+                newest_ids = [*newest_ids, ad.id]
+
+        if self.newest_time is not None:
+            page_size = self.page_size
+            if new_ads_count >= page_size:
+                self.page_size = max(
+                    page_size,
+                    min(config.KUFAR_PAGE_SIZE_MAX, max(page_size * 2, new_ads_count)),
+                )
+            elif new_ads_count <= page_size // 4:
+                self.page_size = min(
+                    page_size, max(config.KUFAR_PAGE_SIZE_MIN, page_size // 2)
+                )
+        self.newest_time = newest_time
+        self.newest_ids = newest_ids
+        self.warmed_up = True
+        return new_ads_count
+
+
+def notify_users(
+    delivery: DeliveryQueue, users_to_notify: list, ad: Ad, extended_details: dict
+):
+    caption = kufar_api.format_ad_message(ad, extended_details)
+    keyboard = keyboards.create_ad_link_keyboard(ad.link)
+
+    for user_id in users_to_notify:
+        delivery.enqueue(Notification(user_id, caption, ad.photo_url, keyboard))
+
+
+def notify_digest(delivery: DeliveryQueue, chat_id: int, mode: str, entries: list):
+    batches = []
+    if mode == "album":
+        with_photo = [entry for entry in entries if entry[0].photo_url]
+        batches.extend(("album", batch) for batch in split_batch(with_photo))
+        entries = [entry for entry in entries if not entry[0].photo_url]
+    batches.extend(("list", batch) for batch in split_batch(entries))
+
+    for kind, batch in batches:
+        if len(batch) == 1:
+            ad, extended_details = batch[0]
+            notification = Notification(
+                chat_id,
+                kufar_api.format_ad_message(ad, extended_details),
+                ad.photo_url,
+                keyboards.create_ad_link_keyboard(ad.link),
+            )
+        elif kind == "album":
+            notification = Notification(
+                chat_id,
+                "",
+                None,
+                None,
+                album=[
+                    (ad.photo_url, kufar_api.format_album_caption(ad, extended_details))
+                    for ad, extended_details in batch
+                ],
+            )
+        else:
+            ads = [ad for ad, _ in batch]
+            notification = Notification(
+                chat_id,
+                kufar_api.format_digest_message(ads),
+                None,
+                keyboards.create_ad_links_keyboard([ad.link for ad in ads]),
+            )
+        delivery.enqueue(notification)
+
+
+def log_discovery(ad: Ad, discovery_time_utc: datetime | None = None):
+    ad_id = ad.id
+    discovery_time_utc = discovery_time_utc or datetime.now(timezone.utc)
+    ad_time_utc = ad.timestamp
+
+    delay_seconds = -1
+    if ad_time_utc:
+        delay = discovery_time_utc - ad_time_utc
+        delay_seconds = delay.total_seconds()
+        metrics.api_delay.observe(delay_seconds)
+    metrics.new_ads_found.inc()
+
+    ad_subject = ad.subject
+    logging.debug(
+        f'Обнаружено: "{ad_subject}" (ID: {ad_id}) | Задержка API: {delay_seconds:.2f} сек.'
+    )
+
+    if delay_seconds > config.API_DELAY_WARNING_THRESHOLD:
+        logging.warning(
+            f"Высокая задержка API Kufar: {delay_seconds:.2f} сек!\n"
+            f'  - Объявление: "{ad_subject}" (ID: {ad_id})\n'
+            f"  - Время Kufar: {ad_time_utc.isoformat() if ad_time_utc else 'N/A'}\n"
+            f"  - Время обнаружения: {discovery_time_utc.isoformat()}"
+        )
+
+
+class AdNotifier:
+    def __init__(self, bot: Bot):
+        self.registry = data_manager.get_registry()
+        self.persist_seen_ads = config.DEDUP_MODE != "watermark"
+        if self.persist_seen_ads:
+            self.seen_ads = data_manager.get_seen_ads()
+        else:
+            self.seen_ads = SeenAdStore(RECENT_ADS_TTL, RECENT_ADS_MAX_SIZE)
+        self.media_cache = MediaCache(config.MEDIA_CACHE_SIZE)
+        self.delivery = DeliveryQueue(
+            bot,
+            workers=config.DELIVERY_WORKERS,
+            global_rate=config.TELEGRAM_GLOBAL_RATE,
+            chat_rate=config.TELEGRAM_CHAT_RATE,
+            chat_burst=config.TELEGRAM_CHAT_BURST,
+            max_attempts=config.DELIVERY_MAX_ATTEMPTS,
+            media_cache=self.media_cache,
+        )
+        self.digests = DigestBatcher(
+            config.DIGEST_WINDOW,
+            config.DIGEST_MAX_ADS,
+            lambda chat_id, mode, entries: notify_digest(
+                self.delivery, chat_id, mode, entries
+            ),
+        )
+        metrics.delivery_queue_size.set_function(lambda: len(self.delivery))
+        metrics.seen_ads_size.set_function(lambda: len(self.seen_ads))
+
+    def start(self, session):
+        self.media_cache.session = session
+        self.delivery.start()
+
+    async def stop(self):
+        self.digests.flush_all()
+        await self.delivery.stop(config.DELIVERY_DRAIN_TIMEOUT)
+        # Searches resuming from a watermark skip the warm-up, so ads sent
+        # since the last housekeeping must be in the store after a restart.
+        if self.persist_seen_ads and self.seen_ads.unsaved_count:
+            data_manager.save_seen_ads(self.seen_ads)
+
+    def claim(self, candidates: list) -> set:
+        claimed_ids = set()
+        for ad_id, matched in candidates:
+            if ad_id in self.seen_ads:
+                self.seen_ads.touch(ad_id)
+            elif matched:
+                self.seen_ads.add(ad_id)
+                claimed_ids.add(ad_id)
+        return claimed_ids
+
+    def notify(self, found_ads: list, all_details: list):
+        delivery_modes = {}
+        for (ad, matched_keys), extended_details in zip(found_ads, all_details):
+            users_to_notify = []
+            for user_id in dict.fromkeys(
+                user_id
+                for query_key in matched_keys
+                for user_id in self.registry.get_subscribers(query_key)
+            ):
+                mode = delivery_modes.get(user_id)
+                if mode is None:
+                    mode = delivery_modes[user_id] = self.registry.get_user_settings(
+                        user_id
+                    ).get("delivery_mode", DEFAULT_DELIVERY_MODE)
+                if mode == DEFAULT_DELIVERY_MODE:
+                    users_to_notify.append(user_id)
+                else:
+                    self.digests.add(user_id, mode, ad, extended_details)
+            if users_to_notify:
+                notify_users(self.delivery, users_to_notify, ad, extended_details)
+
+    def remember_warm_up(self, ad_ids: set):
+        if self.persist_seen_ads:
+            self.seen_ads.update(ad_ids)
+            data_manager.save_seen_ads(self.seen_ads)
+        logging.info(
+            f"Прогрев кеша: добавлено {len(ad_ids)} ID, в кеше {len(self.seen_ads)} ID."
+        )
+
+    def housekeeping(self):
+        self.delivery.prune()
+        logging.debug(
+            f"Очередь отправки: {len(self.delivery)} в ожидании, "
+            f"отправлено {self.delivery.sent_count}, ошибок {self.delivery.failed_count}."
+        )
+
+        expired_count = self.seen_ads.evict_expired()
+        if self.persist_seen_ads and self.seen_ads.unsaved_count:
+            save_start_time = time.monotonic()
+            unsaved_count = self.seen_ads.unsaved_count
+            data_manager.save_seen_ads(self.seen_ads)
+            logging.debug(
+                f"Кеш сохранен: {unsaved_count} изменений, из них {expired_count} устаревших ID удалено. В кеше {len(self.seen_ads)} ID."
+            )
+            logging.debug(
+                f"[TIMER] Сохранение кеша заняло: {time.monotonic() - save_start_time:.4f} сек."
+            )
+
+
+class SearchPoller(ABC):
+    def __init__(
+        self,
+        kufar_client: KufarClient,
+        concurrency: int,
+    ):
+        self.kufar_client = kufar_client
+        self.concurrency = max(1, concurrency)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.scheduler = QueryScheduler(
+            min_interval=config.POLL_INTERVAL_MIN,
+            max_interval=config.POLL_INTERVAL_MAX,
+            initial_interval=config.DELAY_MAIN_LOOP,
+        )
+        self.enricher = Enricher(
+            concurrency=config.ENRICHMENT_CONCURRENCY,
+            timeout=config.ENRICHMENT_TIMEOUT,
+            cache_size=config.ENRICHMENT_CACHE_SIZE,
+            cache_ttl=config.ENRICHMENT_CACHE_TTL,
+        )
+        self.plan = {}
+        self.search_states = {}
+        self.watermarks = WatermarkStore()
+        self.stats = FetchStats()
+        self.session = None
+        self._running_tasks = set()
+        self._queries_changed = asyncio.Event()
+        metrics.checks_in_flight.set_function(lambda: len(self._running_tasks))
+        metrics.scheduled_searches.set_function(lambda: len(self.scheduler))
+
+    def set_plan(self, plan: dict):
+        self.plan = plan
+        self.scheduler.sync(self.plan)
+        for group_key in list(self.search_states):
+            if group_key not in self.plan:
+                del self.search_states[group_key]
+        self._queries_changed.set()
+
+    @abstractmethod
+    async def claim_ads(self, candidates: list) -> list:
+        pass
+
+    @abstractmethod
+    def deliver(self, found_ads: list, all_details: list):
+        pass
+
+    @abstractmethod
+    async def finish_warm_up(self, ad_ids: set):
+        pass
+
+    def get_search_state(self, group_key: frozenset, group_params: dict):
+        search_state = self.search_states.get(group_key)
+        if search_state is None:
+            search_state = SearchState(group_params["limit"])
+            # A search checked before the restart resumes from its watermark.
+            if watermark := self.watermarks.get(planner.get_group_id(group_key)):
+                search_state.restore(*watermark)
+            self.search_states[group_key] = search_state
+        return search_state
+
+    def remember_position(self, group_key: frozenset, search_state: SearchState):
+        if watermark := search_state.watermark():
+            self.watermarks.set(planner.get_group_id(group_key), *watermark)
+
+    async def fetch_page(
+        self, params: dict, cursor: str | None, conditional_headers: dict | None
+    ) -> tuple:
+        stats = self.stats
+        async with self.semaphore:
+            stats.in_flight += 1
+            stats.requests_count += 1
+            stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+            request_start_time = time.monotonic()
+            result = "error"
+            try:
+                page = await kufar_api.fetch_ads_page(
+                    self.session, params, cursor, conditional_headers
+                )
+                result = "ok" if page[0] is not None else "not_modified"
+                return page
+            finally:
+                request_duration = time.monotonic() - request_start_time
+                stats.busy_time += request_duration
+                stats.in_flight -= 1
+                metrics.kufar_search_requests.inc(result=result)
+                metrics.kufar_search_duration.observe(request_duration)
+
+    async def fetch_ads(
+        self, group_params: dict, search_state: SearchState, conditional: bool = False
+    ) -> list | None:
+        params = kufar_api.build_search_params(
+            {**group_params, "limit": search_state.page_size}
+        )
+        # Conditional headers are only sent for the first page; None is returned
+        # when Kufar answers that the result has not changed.
+        conditional_headers = search_state.conditional_headers if conditional else {}
+        ads, cursor = [], None
+        for page_number in range(config.KUFAR_MAX_PAGES):
+            # Errors are not caught here: a failed or partial result must not
+            # move the search position, the check is retried as a whole.
+            page_ads, cursor, response_headers = await self.fetch_page(
+                params, cursor, conditional_headers if page_number == 0 else None
+            )
+            if page_ads is None:
+                return None
+            if page_number == 0:
+                search_state.conditional_headers = response_headers
+            ads.extend(page_ads)
+            if (
+                search_state.newest_time is None
+                or not page_ads
+                or not cursor
+                or search_state.reaches_known(page_ads)
+            ):
+                break
+        else:
+            logging.warning(
+                f"Запрос «{group_params.get('query')}»: прочитано {config.KUFAR_MAX_PAGES} "
+                f"страниц, но не все новые объявления получены."
+            )
+        return ads
+
+    async def check_group(self, group_key: frozenset) -> int:
+        group_check_start_time = time.monotonic()
+        member_keys = self.plan.get(group_key)
+        if not member_keys:
+            return 0
+        group_params = planner.get_group_params(member_keys)
+        if self.kufar_client.breakers["search"].is_open():
+            logging.debug(
+                f"Проверка запроса «{group_params.get('query')}» пропущена: "
+                f"поиск Kufar временно приостановлен."
+            )
+            return 0
+        search_state = self.get_search_state(group_key, group_params)
+        # Once the previous newest ad is known, everything newer is read, so the
+        # per-query limit only applies to the very first page.
+        use_limit = search_state.newest_time is None
+        new_ads = await self.fetch_ads(
+            group_params, search_state, search_state.can_skip(member_keys)
+        )
+        if new_ads is None or search_state.is_unchanged(member_keys, new_ads):
+            search_state.observe(())
+            logging.debug(
+                f"Результаты запроса «{group_params.get('query')}» не изменились."
+            )
+            return 0
+        if not search_state.warmed_up:
+            # A search added after the start has no position yet: its current
+            # results only set it and are marked as seen (also in the cluster
+            # store, whichever node received the new query) without notifying.
+            search_state.observe(new_ads)
+            self.remember_position(group_key, search_state)
+            await self.finish_warm_up({ad.id for ad in new_ads if ad.id})
+            return 0
+        if config.DEDUP_MODE == "watermark":
+            # Only ads above the watermark are new; the seen-ad store merely
+            # guards against other searches that found them at the same time.
+            new_ads = search_state.select_new(new_ads)
+        search_state.observe(new_ads)
+        self.remember_position(group_key, search_state)
+        allowed_ids = {
+            query_key: {
+                ad.id
+                for ad in planner.filter_ads_for_query(
+                    new_ads, dict(query_key), group_params["city"], use_limit
+                )
+            }
+            for query_key in member_keys
+        }
+        found_ads = await self.claim_ads(
+            [
+                (
+                    ad,
+                    [key for key in member_keys if ad.id in allowed_ids[key]],
+                )
+                for ad in reversed(new_ads)
+            ]
+        )
+
+        all_details = []
+        if found_ads:
+            enrichment_start_time = time.monotonic()
+            all_details = await self.enricher.enrich_all(
+                self.session, [ad for ad, _ in found_ads]
+            )
+            logging.debug(
+                f"[TIMER] Загрузка деталей {len(found_ads)} объявлений заняла: {time.monotonic() - enrichment_start_time:.4f} сек."
+            )
+
+        self.deliver(found_ads, all_details)
+
+        logging.debug(
+            f"[TIMER] Проверка запроса «{group_params.get('query')}» "
+            f"({len(member_keys)} подписок) заняла: {time.monotonic() - group_check_start_time:.4f} сек."
+        )
+        return len(found_ads)
+
+    async def run_scheduled_group(self, group_key: frozenset):
+        notified_count = 0
+        check_start_time = time.monotonic()
+        try:
+            notified_count = await self.check_group(group_key)
+        except Exception as e:
+            logging.error(f"Ошибка при проверке запроса {dict(group_key)}: {e}")
+        finally:
+            metrics.query_check_duration.observe(time.monotonic() - check_start_time)
+            self.scheduler.reschedule(group_key, notified_count)
+            logging.debug(
+                f"Следующая проверка запроса «{dict(group_key).get('query')}» "
+                f"через {self.scheduler.interval_for(group_key) or 0:.1f} сек."
+            )
+
+    async def warm_up(self):
+        logging.info("Первый запуск: начинаем прогрев кеша...")
+        pending = {
+            group_key: member_keys
+            for group_key, member_keys in self.plan.items()
+            if planner.get_group_id(group_key) not in self.watermarks
+        }
+        logging.info(
+            f"Запросов к Kufar: {len(self.plan)}, продолжают с сохраненной позиции: "
+            f"{len(self.plan) - len(pending)}, требуют прогрева: {len(pending)}."
+        )
+
+        # Searches are fetched concurrently; the semaphore and the shared rate
+        # limit in fetch_page keep the load on Kufar within the usual bounds.
+        results = await asyncio.gather(
+            *(
+                self.warm_up_group(group_key, member_keys)
+                for group_key, member_keys in pending.items()
+            )
+        )
+        initial_ids_to_cache = {
+            ad_id for ads in results for ad in ads if (ad_id := ad.id)
+        }
+        await self.finish_warm_up(initial_ids_to_cache)
+
+    async def warm_up_group(self, group_key: frozenset, member_keys: list) -> list:
+        group_params = planner.get_group_params(member_keys)
+        search_state = self.get_search_state(group_key, group_params)
+        try:
+            ads = await self.fetch_ads(group_params, search_state)
+        except Exception as e:
+            # The search stays without a position and its first scheduled
+            # check is the warm-up.
+            logging.error(
+                f"Не удалось прогреть запрос «{group_params.get('query')}»: {e}"
+            )
+            return []
+        search_state.observe(ads)
+        self.remember_position(group_key, search_state)
+        return ads
+
+    def housekeeping(self, period_duration: float):
+        stats = self.stats
+        if period_duration > 0 and stats.requests_count:
+            parallelism = stats.busy_time / period_duration
+            logging.debug(
+                f"[TIMER] За {period_duration:.1f} сек. выполнено {stats.requests_count} запросов к Kufar. "
+                f"Параллелизм запросов: средний {parallelism:.2f}, пиковый {stats.peak_in_flight} "
+                f"(лимит {self.concurrency})."
+            )
+        self.stats = FetchStats()
+
+    async def run_schedule(self):
+        try:
+            period_start_time = time.monotonic()
+            next_housekeeping_time = period_start_time
+            while True:
+                now = time.monotonic()
+
+                if now >= next_housekeeping_time:
+                    self.housekeeping(now - period_start_time)
+                    period_start_time = now
+                    next_housekeeping_time = now + config.DELAY_MAIN_LOOP
+
+                for group_key in self.scheduler.pop_due(now):
+                    task = asyncio.create_task(self.run_scheduled_group(group_key))
+                    self._running_tasks.add(task)
+                    task.add_done_callback(self._running_tasks.discard)
+
+                sleep_time = next_housekeeping_time - time.monotonic()
+                seconds_until_next = self.scheduler.seconds_until_next()
+                if seconds_until_next is not None:
+                    sleep_time = min(sleep_time, seconds_until_next)
+                self._queries_changed.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._queries_changed.wait(), max(sleep_time, 0.05)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in self._running_tasks:
+                task.cancel()
+            await self.enricher.stop()
+
+
+class Poller(SearchPoller):
+    def __init__(
+        self,
+        bot: Bot,
+        kufar_client: KufarClient,
+        cluster: ClusterCoordinator | None = None,
+    ):
+        super().__init__(
+            kufar_client,
+            concurrency=config.POLLING_CONCURRENCY,
+        )
+        self.notifier = AdNotifier(bot)
+        self.registry = self.notifier.registry
+        self.watermarks = data_manager.get_watermarks()
+        self.cluster = cluster
+        self.full_plan = {}
+        self._leases_renewed_at = time.monotonic()
+        self._shared_marks = {}
+        self._positions_loaded = set()
+
+    def rebuild_plan(self):
+        unique_queries = self.registry.unique_queries()
+        self.full_plan = planner.build_plan(unique_queries)
+        self.watermarks.retain(planner.get_group_id(key) for key in self.full_plan)
+        self.apply_ownership()
+        logging.debug(
+            f"План опроса: {len(unique_queries)} уникальных запросов "
+            f"объединены в {len(self.full_plan)} запросов к Kufar, "
+            f"опрашивает этот узел: {len(self.plan)}."
+        )
+
+    def apply_ownership(self):
+        if self.cluster is None:
+            self.set_plan(self.full_plan)
+            return
+        self.set_plan(
+            {
+                group_key: member_keys
+                for group_key, member_keys in self.full_plan.items()
+                if group_key in self.cluster.owned
+                and group_key in self._positions_loaded
+            }
+        )
+
+    async def update_leases(self):
+        try:
+            await self.share_watermarks()
+            await self.cluster.update_leases(self.full_plan)
+            self._leases_renewed_at = time.monotonic()
+        except Exception as e:
+            logging.error(f"Ошибка обновления аренды запросов в кластере: {e}")
+            if time.monotonic() - self._leases_renewed_at > self.cluster.lease_ttl:
+                # The leases have run out and other nodes may already poll
+                # these searches.
+                self.cluster.owned.clear()
+        await self.load_shared_watermarks()
+        self.apply_ownership()
+        metrics.cluster_owned_searches.set(len(self.plan))
+        metrics.cluster_live_nodes.set(len(self.cluster.nodes))
+
+    async def share_watermarks(self):
+        # Positions are published before a lease can be released, so the next
+        # owner resumes where this node stopped.
+        marks = {}
+        for group_key in self.cluster.owned:
+            group_id = planner.get_group_id(group_key)
+            if (mark := self.watermarks.get(group_id)) is not None:
+                marks[group_id] = mark
+        await self.cluster.save_watermarks(
+            {
+                group_id: mark
+                for group_id, mark in marks.items()
+                if self._shared_marks.get(group_id) != mark
+            }
+        )
+        self._shared_marks = marks
+
+    async def load_shared_watermarks(self):
+        # A search taken over from another node is polled only after its
+        # shared position is read; without it the first check would be a
+        # silent warm-up and the ads published during the handover were lost.
+        self._positions_loaded.intersection_update(self.cluster.owned)
+        taken_over = [
+            group_key
+            for group_key in self.cluster.owned
+            if group_key not in self._positions_loaded
+        ]
+        if not taken_over:
+            return
+        try:
+            marks = await self.cluster.load_watermarks(
+                [planner.get_group_id(group_key) for group_key in taken_over]
+            )
+        except Exception as e:
+            logging.error(f"Ошибка чтения позиций запросов из хранилища кластера: {e}")
+            return
+        for group_id, (list_time, ad_ids) in marks.items():
+            self.watermarks.set(group_id, list_time, ad_ids)
+        self._positions_loaded.update(taken_over)
+
+    async def maintain_cluster(self):
+        while True:
+            await asyncio.sleep(self.cluster.lease_ttl / 3)
+            try:
+                self.registry.reload()
+            except Exception as e:
+                logging.error(f"Ошибка перезагрузки реестра: {e}")
+            await self.update_leases()
+
+    async def claim_ads(self, candidates: list) -> list:
+        # Groups are checked concurrently, so ads are marked as seen before
+        # the first await to keep another group from notifying them twice.
+        claimed_ids = self.notifier.claim(
+            [(ad.id, bool(matched_keys)) for ad, matched_keys in candidates]
+        )
+        if self.cluster is not None:
+            claimed_ids = await self.claim_in_cluster(candidates, claimed_ids)
+        found_ads = []
+        for ad, matched_keys in candidates:
+            if ad.id in claimed_ids:
+                log_discovery(ad)
+                found_ads.append((ad, matched_keys))
+        return found_ads
+
+    async def claim_in_cluster(self, candidates: list, claimed_ids: set) -> set:
+        # The shared store decides for ads that are new to this node: another
+        # node may have sent them before the search changed owner.
+        known_ids = [ad.id for ad, _ in candidates if ad.id not in claimed_ids]
+        try:
+            await self.cluster.touch_ads(known_ids)
+            return await self.cluster.claim_ads(list(claimed_ids))
+        except Exception as e:
+            logging.error(f"Ошибка проверки объявлений в хранилище кластера: {e}")
+            return claimed_ids
+
+    def deliver(self, found_ads: list, all_details: list):
+        self.notifier.notify(found_ads, all_details)
+
+    async def finish_warm_up(self, ad_ids: set):
+        self.notifier.remember_warm_up(ad_ids)
+        if self.cluster is not None:
+            try:
+                await self.cluster.claim_ads(list(ad_ids))
+            except Exception as e:
+                logging.error(f"Ошибка сохранения прогрева в хранилище кластера: {e}")
+
+    def save_watermarks(self):
+        if self.watermarks.unsaved_count:
+            data_manager.save_watermarks(self.watermarks)
+
+    def housekeeping(self, period_duration: float):
+        super().housekeeping(period_duration)
+        self.notifier.housekeeping()
+        self.save_watermarks()
+
+    async def run(self):
+        logging.info("Запуск задачи polling_task...")
+        self.session = self.kufar_client.session
+        self.notifier.start(self.session)
+        maintenance = None
+        try:
+            self.rebuild_plan()
+            if self.cluster is not None:
+                logging.info(f"Узел кластера {self.cluster.node_id} запущен.")
+                await self.update_leases()
+                maintenance = asyncio.create_task(self.maintain_cluster())
+            await self.warm_up()
+            self.registry.add_listener(self.rebuild_plan)
+            await self.run_schedule()
+        finally:
+            if maintenance is not None:
+                maintenance.cancel()
+                await asyncio.gather(maintenance, return_exceptions=True)
+                try:
+                    await self.share_watermarks()
+                    await self.cluster.leave()
+                except Exception as e:
+                    logging.error(f"Ошибка выхода узла из кластера: {e}")
+            self.save_watermarks()
+            await self.notifier.stop()
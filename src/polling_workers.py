@@ -0,0 +1,281 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+from datetime import datetime, timezone
+
+from aiogram import Bot
+
+from src import config
+from src.logging_config import setup_logging
+from src.poller import AdNotifier, SearchPoller, log_discovery
+from src.utils import data_manager, metrics, planner
+from src.utils.kufar_client import KufarClient, create_kufar_client
+
+WORKER_STOP_TIMEOUT = 5
+
+
+def get_shard(group_key: frozenset, shards_count: int) -> int:
+    return int(planner.get_group_id(group_key), 16) % shards_count
+
+
+def split_plan(plan: dict, shards_count: int) -> list:
+    shards = [{} for _ in range(shards_count)]
+    for group_key, member_keys in plan.items():
+        shards[get_shard(group_key, shards_count)][group_key] = member_keys
+    return shards
+
+
+async def receive(queue: multiprocessing.Queue):
+    return await asyncio.get_running_loop().run_in_executor(None, queue.get)
+
+
+class WorkerPoller(SearchPoller):
+    def __init__(
+        self,
+        worker_id: int,
+        workers_count: int,
+        commands: multiprocessing.Queue,
+        results: multiprocessing.Queue,
+    ):
+        super().__init__(
+            create_kufar_client(workers_count),
+            # Process-wide limits are shared evenly between the workers.
+            concurrency=config.POLLING_CONCURRENCY // workers_count,
+        )
+        self.worker_id = worker_id
+        self.commands = commands
+        self.results = results
+        self._claim_ids = itertools.count()
+        self._pending_claims = {}
+        self._discovered_at = {}
+        self._plan_received = asyncio.Event()
+
+    async def claim_ads(self, candidates: list) -> list:
+        # Only the main process knows which ads were already sent, so every
+        # candidate is claimed there before the ad page is loaded.
+        claim_id = next(self._claim_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending_claims[claim_id] = future
+        self.results.put(
+            (
+                "claim",
+                self.worker_id,
+                claim_id,
+                [(ad.id, bool(keys)) for ad, keys in candidates],
+            )
+        )
+        claimed_ids = await future
+        discovered_at = datetime.now(timezone.utc)
+        found_ads = []
+        for ad, matched_keys in candidates:
+            if ad.id in claimed_ids:
+                self._discovered_at[ad.id] = discovered_at
+                found_ads.append((ad, matched_keys))
+        return found_ads
+
+    def deliver(self, found_ads: list, all_details: list):
+        if not found_ads:
+            return
+        self.results.put(
+            (
+                "found",
+                [
+                    (
+                        ad,
+                        matched_keys,
+                        details,
+                        self._discovered_at.pop(ad.id),
+                    )
+                    for (ad, matched_keys), details in zip(found_ads, all_details)
+                ],
+            )
+        )
+
+    async def finish_warm_up(self, ad_ids: set):
+        self.results.put(("seen", ad_ids))
+
+    def send_watermarks(self):
+        updated, _ = self.watermarks.pop_changes()
+        if updated:
+            self.results.put(("watermarks", updated))
+
+    def send_metrics(self):
+        # Kufar requests and checks happen only in the workers, so their
+        # metrics are exported by the main process from these snapshots.
+        self.results.put(("metrics", self.worker_id, metrics.registry.collect()))
+
+    def housekeeping(self, period_duration: float):
+        super().housekeeping(period_duration)
+        self.send_watermarks()
+        self.send_metrics()
+
+    async def read_commands(self):
+        while True:
+            command, *payload = await receive(self.commands)
+            if command == "watermarks":
+                self.watermarks.load_records(payload[0])
+            elif command == "plan":
+                self.set_plan(payload[0])
+                self._plan_received.set()
+            elif command == "claimed":
+                claim_id, claimed_ids = payload
+                if future := self._pending_claims.pop(claim_id, None):
+                    future.set_result(claimed_ids)
+            elif command == "stop":
+                return
+
+    async def poll(self):
+        await self._plan_received.wait()
+        await self.warm_up()
+        await self.run_schedule()
+
+    async def run(self):
+        await self.kufar_client.start()
+        self.session = self.kufar_client.session
+        reader = asyncio.create_task(self.read_commands())
+        polling = asyncio.create_task(self.poll())
+        try:
+            await asyncio.wait([reader, polling], return_when=asyncio.FIRST_COMPLETED)
+            for task in (reader, polling):
+                if task.done() and task.exception():
+                    raise task.exception()
+        finally:
+            polling.cancel()
+            if not reader.done():
+                # Wakes the thread blocked on the queue so the loop can close.
+                self.commands.put(("stop",))
+                await reader
+            await asyncio.gather(polling, return_exceptions=True)
+            self.send_watermarks()
+            self.send_metrics()
+            await self.kufar_client.close()
+
+
+def run_worker(
+    worker_id: int,
+    workers_count: int,
+    commands: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+):
+    setup_logging(f"worker {worker_id}")
+    try:
+        asyncio.run(WorkerPoller(worker_id, workers_count, commands, results).run())
+    except KeyboardInterrupt:
+        pass
+
+
+class WorkerPool:
+    def __init__(self, bot: Bot, kufar_client: KufarClient, workers_count: int):
+        self.kufar_client = kufar_client
+        self.workers_count = max(1, workers_count)
+        self.notifier = AdNotifier(bot)
+        self.registry = self.notifier.registry
+        self.watermarks = data_manager.get_watermarks()
+        self.shards = [{} for _ in range(self.workers_count)]
+        # Processes are spawned rather than forked: the parent already runs an
+        # event loop and open connections that must not be copied.
+        self._context = multiprocessing.get_context("spawn")
+        self.results = self._context.Queue()
+        self.processes = [None] * self.workers_count
+        self.commands = [None] * self.workers_count
+        # No limited Kufar request goes through this process, the workers
+        # report their own limiters.
+        metrics.kufar_request_rate.set_function(None)
+
+    def start_worker(self, worker_id: int):
+        commands = self._context.Queue()
+        process = self._context.Process(
+            target=run_worker,
+            args=(worker_id, self.workers_count, commands, self.results),
+            name=f"kufar-poller-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        self.commands[worker_id] = commands
+        self.processes[worker_id] = process
+        commands.put(("watermarks", self.watermarks.to_records()))
+        commands.put(("plan", self.shards[worker_id]))
+
+    def distribute_plan(self):
+        unique_queries = self.registry.unique_queries()
+        plan = planner.build_plan(unique_queries)
+        self.watermarks.retain(planner.get_group_id(key) for key in plan)
+        self.shards = split_plan(plan, self.workers_count)
+        for worker_id, commands in enumerate(self.commands):
+            if commands is not None:
+                commands.put(("plan", self.shards[worker_id]))
+        logging.debug(
+            f"План опроса: {len(plan)} запросов к Kufar распределены между "
+            f"{self.workers_count} процессами: {[len(shard) for shard in self.shards]}."
+        )
+
+    def handle_result(self, message: tuple):
+        kind, *payload = message
+        if kind == "claim":
+            worker_id, claim_id, candidates = payload
+            claimed_ids = self.notifier.claim(candidates)
+            self.commands[worker_id].put(("claimed", claim_id, claimed_ids))
+        elif kind == "found":
+            found_ads, all_details = [], []
+            for ad, matched_keys, details, discovered_at in payload[0]:
+                log_discovery(ad, discovered_at)
+                found_ads.append((ad, matched_keys))
+                all_details.append(details)
+            self.notifier.notify(found_ads, all_details)
+        elif kind == "seen":
+            self.notifier.remember_warm_up(payload[0])
+        elif kind == "metrics":
+            worker_id, snapshot = payload
+            metrics.registry.update_source(worker_id, snapshot)
+        elif kind == "watermarks":
+            for group_id, list_time, ad_ids in payload[0]:
+                self.watermarks.set(group_id, list_time, ad_ids)
+
+    async def read_results(self):
+        while (message := await receive(self.results)) is not None:
+            try:
+                self.handle_result(message)
+            except Exception as e:
+                logging.error(f"Ошибка обработки сообщения от процесса опроса: {e}")
+
+    def save_watermarks(self):
+        if self.watermarks.unsaved_count:
+            data_manager.save_watermarks(self.watermarks)
+
+    def check_workers(self):
+        for worker_id, process in enumerate(self.processes):
+            if not process.is_alive():
+                logging.error(
+                    f"Процесс опроса {worker_id} завершился с кодом {process.exitcode}, "
+                    f"перезапускаем."
+                )
+                self.start_worker(worker_id)
+
+    async def run(self):
+        logging.info(f"Запуск опроса в {self.workers_count} процессах...")
+        self.notifier.start(self.kufar_client.session)
+        self.distribute_plan()
+        for worker_id in range(self.workers_count):
+            self.start_worker(worker_id)
+        self.registry.add_listener(self.distribute_plan)
+        reader = asyncio.create_task(self.read_results())
+        try:
+            while True:
+                await asyncio.sleep(config.DELAY_MAIN_LOOP)
+                self.notifier.housekeeping()
+                self.save_watermarks()
+                self.check_workers()
+        finally:
+            for commands in self.commands:
+                commands.put(("stop",))
+            for process in self.processes:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, process.join, WORKER_STOP_TIMEOUT
+                )
+                if process.is_alive():
+                    process.terminate()
+            self.results.put(None)
+            await reader
+            self.save_watermarks()
+            await self.notifier.stop()
@@ -0,0 +1,96 @@
+from datetime import datetime
+
+from src import config
+
+
+def parse_timestamp(list_time: str | None) -> datetime | None:
+    if list_time:
+        try:
+            return datetime.fromisoformat(list_time.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return None
+
+
+def parse_price(value) -> int | None:
+    # Kufar sends prices in kopecks/cents as strings.
+    try:
+        return int(value) // 100
+    except (ValueError, TypeError):
+        return None
+
+
+def get_photo_url(images: list | None) -> str | None:
+    if not images:
+        return None
+    if images[0].get("media_storage") == "rms":
+        return f"{config.KUFAR_MEDIA_BASE_URL}/v1/gallery/{images[0].get('path')}"
+    return None
+
+
+class Ad:
+    # Built once per ad from the search response; the poller, filters and the
+    # message formatter only read these pre-parsed fields.
+    __slots__ = (
+        "id",
+        "link",
+        "subject",
+        "list_time",
+        "timestamp",
+        "price_byn",
+        "price_usd",
+        "region",
+        "region_name",
+        "area",
+        "photo_url",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        link: str | None,
+        subject: str,
+        list_time: str | None,
+        price_byn: int | None,
+        price_usd: int | None,
+        region: str | None = None,
+        region_name: str = "",
+        area: str = "",
+        photo_url: str | None = None,
+    ):
+        self.id = id
+        self.link = link
+        self.subject = subject
+        self.list_time = list_time
+        self.timestamp = parse_timestamp(list_time)
+        self.price_byn = price_byn
+        self.price_usd = price_usd
+        self.region = region
+        self.region_name = region_name
+        self.area = area
+        self.photo_url = photo_url
+
+    @classmethod
+    def from_api(cls, data: dict) -> "Ad":
+        region, region_name, area = None, "", ""
+        for param in data.get("ad_parameters") or ():
+            if param.get("p") == "region":
+                region = param.get("v")
+                region_name = param.get("vl") or ""
+            elif param.get("p") == "area":
+                area = param.get("vl") or ""
+        return cls(
+            id=data.get("ad_id"),
+            link=data.get("ad_link"),
+            subject=data.get("subject", "Без заголовка"),
+            list_time=data.get("list_time"),
+            price_byn=parse_price(data.get("price_byn", "0")),
+            price_usd=parse_price(data.get("price_usd", "0")),
+            region=region,
+            region_name=region_name,
+            area=area,
+            photo_url=get_photo_url(data.get("images")),
+        )
+
+    def __repr__(self) -> str:
+        return f"Ad(id={self.id!r}, subject={self.subject!r})"
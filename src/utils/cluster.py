@@ -0,0 +1,324 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from urllib.parse import urlparse
+
+from src.utils import planner
+
+
+class RedisError(Exception):
+    pass
+
+
+def encode_command(*args) -> bytes:
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Соединение с Redis закрыто")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode()
+    if kind == b"-":
+        return RedisError(payload.decode())
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length == -1:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2].decode()
+    if kind == b"*":
+        length = int(payload)
+        if length == -1:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RedisError(f"Неизвестный ответ Redis: {line!r}")
+
+
+class RedisBackend:
+    # A minimal RESP client: commands are sent in pipelined batches over one
+    # connection, which is all the cluster coordination needs.
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        for reply in await self._send(setup):
+            if isinstance(reply, RedisError):
+                raise reply
+
+    async def _send(self, commands: list) -> list:
+        self._writer.write(b"".join(encode_command(*command) for command in commands))
+        await self._writer.drain()
+        return [await read_reply(self._reader) for _ in commands]
+
+    async def execute_many(self, commands: list) -> list:
+        if not commands:
+            return []
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    await self._connect()
+                return await self._send(commands)
+            except BaseException:
+                # After a cancellation or a cut-off reply the rest of the
+                # replies may still be in the socket, so the connection is
+                # dropped rather than reused out of step.
+                if self._writer is not None:
+                    self._writer.close()
+                    self._writer = None
+                raise
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class MemoryBackend:
+    # In-process stand-in with the same command semantics, for tests and for
+    # several nodes running inside one process.
+    def __init__(self):
+        self._values = {}
+        self._expires = {}
+        self._sorted_sets = {}
+
+    def _alive(self, key: str) -> bool:
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._values.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._values
+
+    def _execute(self, name: str, *args):
+        name = name.upper()
+        if name == "SET":
+            key, value, *options = args
+            options = [str(option).upper() for option in options]
+            if "NX" in options and self._alive(key):
+                return None
+            self._values[key] = str(value)
+            self._expires.pop(key, None)
+            if "PX" in options:
+                ttl = int(options[options.index("PX") + 1]) / 1000
+                self._expires[key] = time.monotonic() + ttl
+            return "OK"
+        if name == "GET":
+            return self._values.get(args[0]) if self._alive(args[0]) else None
+        if name == "DEL":
+            deleted = [key for key in args if self._alive(key)]
+            for key in deleted:
+                del self._values[key]
+                self._expires.pop(key, None)
+            return len(deleted)
+        if name == "PEXPIRE":
+            key, ttl = args
+            if not self._alive(key):
+                return 0
+            self._expires[key] = time.monotonic() + int(ttl) / 1000
+            return 1
+        if name == "ZADD":
+            key, score, member = args
+            self._sorted_sets.setdefault(key, {})[member] = float(score)
+            return 1
+        if name == "ZRANGEBYSCORE":
+            key, low, _ = args
+            members = self._sorted_sets.get(key, {})
+            return [member for member, score in members.items() if score >= float(low)]
+        if name == "ZREMRANGEBYSCORE":
+            key, low, high = args
+            members = self._sorted_sets.get(key, {})
+            removed = [
+                member
+                for member, score in members.items()
+                if float(low) <= score <= float(high)
+            ]
+            for member in removed:
+                del members[member]
+            return len(removed)
+        if name == "ZREM":
+            key, member = args
+            return int(self._sorted_sets.get(key, {}).pop(member, None) is not None)
+        return RedisError(f"ERR unknown command '{name}'")
+
+    async def execute_many(self, commands: list) -> list:
+        return [self._execute(*command) for command in commands]
+
+    async def close(self):
+        pass
+
+
+def create_backend(backend_name: str, redis_url: str):
+    if backend_name == "redis":
+        return RedisBackend(redis_url)
+    if backend_name == "memory":
+        return MemoryBackend()
+    raise ValueError(f"Неизвестный CLUSTER_BACKEND={backend_name}")
+
+
+def get_owner(group_key: frozenset, nodes: list) -> str:
+    # Rendezvous hashing: when a node joins or leaves, only its own share of
+    # searches moves to other nodes.
+    group_id = planner.get_group_id(group_key)
+    return max(
+        nodes,
+        key=lambda node_id: hashlib.blake2b(
+            f"{node_id}:{group_id}".encode(), digest_size=8
+        ).digest(),
+    )
+
+
+class ClusterCoordinator:
+    def __init__(
+        self,
+        backend,
+        node_id: str,
+        lease_ttl: float,
+        seen_ttl: float,
+        prefix: str = "kufar-bot",
+    ):
+        self.backend = backend
+        self.node_id = node_id
+        self.lease_ttl = lease_ttl
+        self.seen_ttl = seen_ttl
+        self.prefix = prefix
+        self.owned = set()
+        self.nodes = [node_id]
+
+    def _key(self, *parts) -> str:
+        return ":".join((self.prefix, *map(str, parts)))
+
+    async def live_nodes(self) -> list:
+        now = time.time()
+        nodes_key = self._key("nodes")
+        replies = await self.backend.execute_many(
+            [
+                ("ZADD", nodes_key, now, self.node_id),
+                ("ZREMRANGEBYSCORE", nodes_key, "-inf", now - self.lease_ttl),
+                ("ZRANGEBYSCORE", nodes_key, now - self.lease_ttl, "+inf"),
+            ]
+        )
+        self.nodes = sorted(set(replies[2]) | {self.node_id})
+        return self.nodes
+
+    async def update_leases(self, plan: dict) -> set:
+        nodes = await self.live_nodes()
+        lease_ms = int(self.lease_ttl * 1000)
+        wanted = [
+            group_key
+            for group_key in plan
+            if get_owner(group_key, nodes) == self.node_id
+        ]
+        # Searches preferring another live node are handed over by dropping
+        # the lease, the new owner picks them up on its next round.
+        released = list(self.owned.difference(wanted))
+        await self._release(released)
+
+        lease_keys = [self._key("lease", planner.get_group_id(key)) for key in wanted]
+        replies = await self.backend.execute_many(
+            [("SET", key, self.node_id, "NX", "PX", lease_ms) for key in lease_keys]
+        )
+        held = [key for key, reply in zip(lease_keys, replies) if reply == "OK"]
+        contested = [key for key, reply in zip(lease_keys, replies) if reply != "OK"]
+        owners = await self.backend.execute_many([("GET", key) for key in contested])
+        renewed = [
+            key for key, owner in zip(contested, owners) if owner == self.node_id
+        ]
+        await self.backend.execute_many([("PEXPIRE", key, lease_ms) for key in renewed])
+
+        owned_keys = set(held) | set(renewed)
+        self.owned = {
+            group_key
+            for group_key, lease_key in zip(wanted, lease_keys)
+            if lease_key in owned_keys
+        }
+        if len(self.owned) < len(wanted):
+            logging.debug(
+                f"Узел {self.node_id}: {len(wanted) - len(self.owned)} запросов "
+                f"еще принадлежат другим узлам."
+            )
+        return self.owned
+
+    async def _release(self, group_keys: list):
+        lease_keys = [
+            self._key("lease", planner.get_group_id(key)) for key in group_keys
+        ]
+        owners = await self.backend.execute_many([("GET", key) for key in lease_keys])
+        await self.backend.execute_many(
+            [
+                ("DEL", key)
+                for key, owner in zip(lease_keys, owners)
+                if owner == self.node_id
+            ]
+        )
+        self.owned.difference_update(group_keys)
+
+    async def claim_ads(self, ad_ids: list) -> set:
+        seen_ms = int(self.seen_ttl * 1000)
+        replies = await self.backend.execute_many(
+            [
+                ("SET", self._key("seen", ad_id), self.node_id, "NX", "PX", seen_ms)
+                for ad_id in ad_ids
+            ]
+        )
+        return {ad_id for ad_id, reply in zip(ad_ids, replies) if reply == "OK"}
+
+    async def touch_ads(self, ad_ids: list):
+        seen_ms = int(self.seen_ttl * 1000)
+        await self.backend.execute_many(
+            [("PEXPIRE", self._key("seen", ad_id), seen_ms) for ad_id in ad_ids]
+        )
+
+    async def load_watermarks(self, group_ids: list) -> dict:
+        replies = await self.backend.execute_many(
+            [("GET", self._key("watermark", group_id)) for group_id in group_ids]
+        )
+        return {
+            group_id: json.loads(reply)
+            for group_id, reply in zip(group_ids, replies)
+            if isinstance(reply, str)
+        }
+
+    async def save_watermarks(self, marks: dict):
+        # Positions live as long as seen ads: once the seen:* keys are gone a
+        # position alone could not prevent duplicates anyway.
+        seen_ms = int(self.seen_ttl * 1000)
+        await self.backend.execute_many(
+            [
+                (
+                    "SET",
+                    self._key("watermark", group_id),
+                    json.dumps(mark),
+                    "PX",
+                    seen_ms,
+                )
+                for group_id, mark in marks.items()
+            ]
+        )
+
+    async def leave(self):
+        await self._release(list(self.owned))
+        await self.backend.execute_many([("ZREM", self._key("nodes"), self.node_id)])
+        await self.backend.close()
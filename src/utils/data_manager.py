@@ -1,47 +1,119 @@
-import json
-import os
+from src.config import (
+    CACHED_ADS_FILE,
+    QUERIES_FILE,
+    SEEN_ADS_MAX_SIZE,
+    SEEN_ADS_TTL_DAYS,
+    SQLITE_DB_FILE,
+    STORAGE_BACKEND,
+    USER_SETTINGS_FILE,
+    USERS_FILE,
+    WATERMARKS_FILE,
+)
+from src.utils.registry import Registry
+from src.utils.seen_ads import SeenAdStore
+from src.utils.storage import JsonStorage, SqliteStorage
+from src.utils.watermarks import WatermarkStore
 
-from src.config import CACHED_ADS_FILE, QUERIES_FILE, USERS_FILE
+_storage = None
+_registry = None
+_seen_ads = None
+_watermarks = None
 
 
-def ensure_data_dir():
-    os.makedirs(os.path.dirname(USERS_FILE), exist_ok=True)
+def get_storage() -> JsonStorage | SqliteStorage:
+    global _storage
+    if _storage is None:
+        json_storage = JsonStorage(
+            USERS_FILE,
+            QUERIES_FILE,
+            CACHED_ADS_FILE,
+            WATERMARKS_FILE,
+            USER_SETTINGS_FILE,
+        )
+        if STORAGE_BACKEND == "sqlite":
+            _storage = SqliteStorage(SQLITE_DB_FILE)
+            _storage.migrate_from_json(json_storage)
+        elif STORAGE_BACKEND == "json":
+            _storage = json_storage
+        else:
+            raise ValueError(f"Неизвестное хранилище STORAGE_BACKEND={STORAGE_BACKEND}")
+    return _storage
 
 
-def load_json(filename, default_value):
-    ensure_data_dir()
-    try:
-        with open(filename, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return default_value
+def get_registry() -> Registry:
+    global _registry
+    if _registry is None:
+        _registry = Registry(get_storage())
+    return _registry
 
 
-def save_json(filename, data):
-    ensure_data_dir()
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+def load_users() -> list:
+    return list(get_registry().users)
 
 
-def load_users():
-    return load_json(USERS_FILE, [])
+def is_user(user_id: int) -> bool:
+    return get_registry().is_user(user_id)
 
 
-def save_users(users):
-    save_json(USERS_FILE, users)
+def add_user(user_id: int) -> bool:
+    return get_registry().add_user(user_id)
 
 
-def load_queries():
-    return load_json(QUERIES_FILE, {})
+def remove_user(user_id: int) -> bool:
+    return get_registry().remove_user(user_id)
 
 
-def save_queries(queries):
-    save_json(QUERIES_FILE, queries)
+def get_user_settings(user_id: int) -> dict:
+    return get_registry().get_user_settings(user_id)
 
 
-def load_cached_ads():
-    return set(load_json(CACHED_ADS_FILE, []))
+def update_user_settings(user_id: int, changes: dict) -> dict:
+    return get_registry().update_user_settings(user_id, changes)
 
 
-def save_cached_ads(ad_ids):
-    save_json(CACHED_ADS_FILE, list(ad_ids))
+def get_user_queries(user_id: int) -> list:
+    return get_registry().get_user_queries(user_id)
+
+
+def get_query(user_id: int, query_id: int) -> dict | None:
+    return get_registry().get_query(user_id, query_id)
+
+
+def add_query(user_id: int, query: dict) -> dict:
+    return get_registry().add_query(user_id, query)
+
+
+def update_query(
+    user_id: int, query_id: int, changes: dict, removed_keys=()
+) -> dict | None:
+    return get_registry().update_query(user_id, query_id, changes, removed_keys)
+
+
+def delete_query(user_id: int, query_id: int) -> dict | None:
+    return get_registry().delete_query(user_id, query_id)
+
+
+def get_seen_ads() -> SeenAdStore:
+    global _seen_ads
+    if _seen_ads is None:
+        _seen_ads = SeenAdStore(
+            ttl_seconds=SEEN_ADS_TTL_DAYS * 24 * 60 * 60, max_size=SEEN_ADS_MAX_SIZE
+        )
+        get_storage().load_seen_ads(_seen_ads)
+    return _seen_ads
+
+
+def save_seen_ads(seen_ads: SeenAdStore):
+    get_storage().save_seen_ads(seen_ads)
+
+
+def get_watermarks() -> WatermarkStore:
+    global _watermarks
+    if _watermarks is None:
+        _watermarks = WatermarkStore()
+        get_storage().load_watermarks(_watermarks)
+    return _watermarks
+
+
+def save_watermarks(watermarks: WatermarkStore):
+    get_storage().save_watermarks(watermarks)
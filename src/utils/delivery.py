@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from aiogram import Bot
+from aiogram.enums import ParseMode
+from aiogram.exceptions import (
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.types import BufferedInputFile, InputMediaPhoto
+
+from src.utils import metrics
+from src.utils.media_cache import MediaCache
+from src.utils.rate_limiter import TokenBucket
+
+
+class Notification:
+    __slots__ = ("chat_id", "text", "photo", "reply_markup", "album", "attempts")
+
+    def __init__(
+        self,
+        chat_id: int,
+        text: str,
+        photo: str | None,
+        reply_markup,
+        album: list | None = None,
+    ):
+        self.chat_id = chat_id
+        self.text = text
+        self.photo = photo
+        self.reply_markup = reply_markup
+        # (photo URL, caption) pairs sent as one media group instead of text.
+        self.album = album
+        self.attempts = 0
+
+
+class DeliveryQueue:
+    def __init__(
+        self,
+        bot: Bot,
+        workers: int,
+        global_rate: float,
+        chat_rate: float,
+        chat_burst: int,
+        max_attempts: int,
+        media_cache: MediaCache,
+    ):
+        self.bot = bot
+        self.media_cache = media_cache
+        self.workers = max(1, workers)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_attempts = max_attempts
+        self.sent_count = 0
+        self.failed_count = 0
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets = {}
+        self._chat_queues = {}
+        # Chats with pending messages that no worker is serving right now.
+        # A chat is in at most one place at a time: here, in a worker or
+        # waiting on a timer, which keeps per-chat order.
+        self._ready = asyncio.Queue()
+        self._paused_until = 0.0
+        self._tasks = []
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._chat_queues.values())
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._worker()) for _ in range(self.workers)
+            ]
+
+    async def stop(self, drain_timeout: float = 0):
+        # Gives queued notifications a chance to go out before the workers
+        # are cancelled; whatever is left after the timeout is dropped.
+        deadline = time.monotonic() + drain_timeout
+        while self._tasks and len(self) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if len(self):
+            logging.warning(
+                f"Остановка отправки: {len(self)} уведомлений не отправлено."
+            )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, notification: Notification):
+        queue = self._chat_queues.get(notification.chat_id)
+        if queue is None:
+            self._chat_queues[notification.chat_id] = deque([notification])
+            self._ready.put_nowait(notification.chat_id)
+        else:
+            queue.append(notification)
+
+    def prune(self):
+        for chat_id in list(self._chat_buckets):
+            if chat_id not in self._chat_queues:
+                del self._chat_buckets[chat_id]
+
+    def _make_ready_later(self, chat_id: int, delay: float):
+        asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, chat_id)
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            try:
+                await self._serve_chat(chat_id)
+            except Exception as e:
+                logging.error(f"Ошибка в очереди отправки для чата {chat_id}: {e}")
+                self._make_ready_later(chat_id, 1)
+
+    async def _serve_chat(self, chat_id: int):
+        queue = self._chat_queues[chat_id]
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        if wait := bucket.try_acquire():
+            self._make_ready_later(chat_id, wait)
+            return
+
+        if (pause := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(pause)
+        await self._global_bucket.acquire()
+
+        notification = queue[0]
+        retry_delay = await self._send(notification)
+        if retry_delay is not None:
+            self._make_ready_later(chat_id, retry_delay)
+            return
+
+        queue.popleft()
+        if queue:
+            self._ready.put_nowait(chat_id)
+        else:
+            del self._chat_queues[chat_id]
+
+    async def _send_photo(self, notification: Notification):
+        url = notification.photo
+        photo = self.media_cache.get_file_id(url)
+        if photo is None:
+            # The first recipient uploads the image, the others wait for its
+            # file_id instead of making Telegram fetch the URL again.
+            try:
+                async with self.media_cache.lock_for(url):
+                    photo = self.media_cache.get_file_id(url)
+                    if photo is None:
+                        await self._upload_photo(notification)
+                        return
+            finally:
+                self.media_cache.release(url)
+
+        await self.bot.send_photo(
+            notification.chat_id,
+            photo=photo,
+            caption=notification.text,
+            parse_mode=ParseMode.HTML,
+            reply_markup=notification.reply_markup,
+        )
+
+    async def _upload_photo(self, notification: Notification):
+        url = notification.photo
+        content = await self.media_cache.download(url)
+        message = await self.bot.send_photo(
+            notification.chat_id,
+            photo=(
+                BufferedInputFile(content, filename=url.rsplit("/", 1)[-1])
+                if content
+                else url
+            ),
+            caption=notification.text,
+            parse_mode=ParseMode.HTML,
+            reply_markup=notification.reply_markup,
+        )
+        if message.photo:
+            self.media_cache.remember(url, message.photo[-1].file_id)
+
+    async def _send_album(self, notification: Notification):
+        # Photos already in Telegram go by file_id, the rest are downloaded
+        # in parallel and uploaded with the album.
+        urls = [url for url, _ in notification.album]
+        missing = [url for url in urls if self.media_cache.get_file_id(url) is None]
+        contents = dict(
+            zip(
+                missing,
+                await asyncio.gather(*map(self.media_cache.download, missing)),
+            )
+        )
+        media = []
+        for url, caption in notification.album:
+            photo = self.media_cache.get_file_id(url)
+            if photo is None:
+                content = contents.get(url)
+                photo = (
+                    BufferedInputFile(content, filename=url.rsplit("/", 1)[-1])
+                    if content
+                    else url
+                )
+            media.append(
+                InputMediaPhoto(media=photo, caption=caption, parse_mode=ParseMode.HTML)
+            )
+        messages = await self.bot.send_media_group(notification.chat_id, media=media)
+        for url, message in zip(urls, messages):
+            if message.photo and self.media_cache.get_file_id(url) is None:
+                self.media_cache.remember(url, message.photo[-1].file_id)
+
+    async def _send(self, notification: Notification) -> float | None:
+        notification.attempts += 1
+        send_start_time = time.monotonic()
+        try:
+            if notification.album:
+                await self._send_album(notification)
+            elif notification.photo:
+                await self._send_photo(notification)
+            else:
+                await self.bot.send_message(
+                    notification.chat_id,
+                    text=notification.text,
+                    parse_mode=ParseMode.HTML,
+                    disable_web_page_preview=True,
+                    reply_markup=notification.reply_markup,
+                )
+            self.sent_count += 1
+            metrics.telegram_sends.inc(result="sent")
+            return None
+        except TelegramRetryAfter as e:
+            # Flood control applies to the whole bot, so every worker pauses.
+            logging.warning(
+                f"Telegram просит подождать {e.retry_after} сек. перед отправкой."
+            )
+            self._paused_until = max(
+                self._paused_until, time.monotonic() + e.retry_after
+            )
+            # Waiting for flood control is not counted as a failed attempt.
+            notification.attempts -= 1
+            metrics.telegram_sends.inc(result="flood_wait")
+            return e.retry_after
+        except (TelegramNetworkError, TelegramServerError) as e:
+            if notification.attempts < self.max_attempts:
+                delay = 2**notification.attempts
+                logging.warning(
+                    f"Временная ошибка отправки пользователю {notification.chat_id} "
+                    f"(попытка {notification.attempts}), повтор через {delay} сек.: {e}"
+                )
+                metrics.telegram_sends.inc(result="retry")
+                return delay
+            error = e
+        except Exception as e:
+            error = e
+        finally:
+            metrics.telegram_send_duration.observe(time.monotonic() - send_start_time)
+        self.failed_count += 1
+        metrics.telegram_sends.inc(result="failed")
+        logging.error(
+            f"Не удалось отправить уведомление пользователю {notification.chat_id}: {error}"
+        )
+        return None
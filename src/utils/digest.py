@@ -0,0 +1,70 @@
+import asyncio
+
+from src.utils import metrics
+
+DEFAULT_DELIVERY_MODE = "single"
+DELIVERY_MODES = {
+    "single": "каждое объявление отдельно",
+    "album": "сводка альбомом",
+    "list": "сводка списком",
+}
+# Telegram accepts at most 10 photos in one media group; list digests are
+# split at the same size to stay well below the message length limit.
+MESSAGE_MAX_ADS = 10
+
+
+def get_next_mode(mode: str) -> str:
+    modes = list(DELIVERY_MODES)
+    index = modes.index(mode) if mode in modes else -1
+    return modes[(index + 1) % len(modes)]
+
+
+def split_batch(entries: list) -> list:
+    return [
+        entries[start : start + MESSAGE_MAX_ADS]
+        for start in range(0, len(entries), MESSAGE_MAX_ADS)
+    ]
+
+
+class DigestBatcher:
+    # Ads found for a digest user are held until the window since the first of
+    # them has passed (or max_ads are collected) and then handed to on_flush
+    # together, so a burst costs the user a few messages instead of one per ad.
+    def __init__(self, window: float, max_ads: int, on_flush):
+        self.window = window
+        self.max_ads = max(1, max_ads)
+        self.on_flush = on_flush
+        self._batches = {}
+        self._modes = {}
+        self._timers = {}
+        metrics.digest_pending_ads.set_function(lambda: len(self))
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._batches.values())
+
+    def add(self, chat_id: int, mode: str, ad, extended_details: dict):
+        entries = self._batches.get(chat_id)
+        if entries is None:
+            entries = self._batches[chat_id] = []
+            self._timers[chat_id] = asyncio.get_running_loop().call_later(
+                self.window, self.flush, chat_id
+            )
+        entries.append((ad, extended_details))
+        self._modes[chat_id] = mode
+        if len(entries) >= self.max_ads:
+            self.flush(chat_id)
+
+    def flush(self, chat_id: int):
+        if timer := self._timers.pop(chat_id, None):
+            timer.cancel()
+        entries = self._batches.pop(chat_id, None)
+        mode = self._modes.pop(chat_id, DEFAULT_DELIVERY_MODE)
+        if entries:
+            metrics.digest_ads.inc(len(entries), mode=mode)
+            self.on_flush(chat_id, mode, entries)
+
+    def flush_all(self):
+        # The ads are already marked as seen, so on shutdown they are sent
+        # right away rather than dropped with their timers.
+        for chat_id in list(self._batches):
+            self.flush(chat_id)
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import time
+
+from curl_cffi.requests import AsyncSession
+
+from src.utils import kufar_api, metrics
+from src.utils.ad import Ad
+from src.utils.cache import TTLCache
+from src.utils.rate_limiter import CircuitOpenError
+
+
+class Enricher:
+    def __init__(
+        self, concurrency: int, timeout: float, cache_size: int, cache_ttl: float
+    ):
+        self.timeout = timeout
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._in_flight = {}
+
+    async def get_details(self, session: AsyncSession, ad: Ad) -> dict:
+        ad_id = ad.id
+        if (details := self.cache.get(ad_id)) is not None:
+            metrics.enrichment_requests.inc(result="cached")
+            return details
+        # Several groups may hit the same ad at once: share one page load.
+        if ad_id not in self._in_flight:
+            self._in_flight[ad_id] = asyncio.ensure_future(self._fetch(session, ad))
+        try:
+            return await asyncio.shield(self._in_flight[ad_id])
+        finally:
+            if self._in_flight.get(ad_id) and self._in_flight[ad_id].done():
+                del self._in_flight[ad_id]
+
+    async def stop(self):
+        # Shared page loads are shielded from the checks waiting on them, so
+        # they are cancelled here, before the session they use is closed.
+        fetches = list(self._in_flight.values())
+        for fetch in fetches:
+            fetch.cancel()
+        await asyncio.gather(*fetches, return_exceptions=True)
+        self._in_flight.clear()
+
+    async def enrich_all(self, session: AsyncSession, ads: list) -> list:
+        return await asyncio.gather(*(self.get_details(session, ad) for ad in ads))
+
+    async def _fetch(self, session: AsyncSession, ad: Ad) -> dict:
+        ad_id = ad.id
+        async with self._semaphore:
+            fetch_start_time = time.monotonic()
+            try:
+                details = await asyncio.wait_for(
+                    kufar_api.get_extended_ad_details(session, ad.link, ad_id),
+                    self.timeout,
+                )
+            except asyncio.TimeoutError:
+                logging.warning(
+                    f"Детали объявления {ad_id} не загружены за {self.timeout} сек., "
+                    f"уведомление будет отправлено без описания."
+                )
+                metrics.enrichment_requests.inc(result="timeout")
+                return kufar_api.get_empty_ad_details()
+            except CircuitOpenError as e:
+                logging.debug(f"Детали объявления {ad_id} не загружены: {e}")
+                metrics.enrichment_requests.inc(result="error")
+                return kufar_api.get_empty_ad_details()
+            except Exception as e:
+                # Not cached: the next check that meets the ad tries again.
+                logging.error(f"Ошибка при загрузке страницы объявления {ad.link}: {e}")
+                metrics.enrichment_requests.inc(result="error")
+                return kufar_api.get_empty_ad_details()
+            finally:
+                metrics.enrichment_duration.observe(time.monotonic() - fetch_start_time)
+        metrics.enrichment_requests.inc(result="ok")
+        self.cache.set(ad_id, details)
+        return details
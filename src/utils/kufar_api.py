@@ -1,19 +1,30 @@
+import html
+import json
 import logging
 import re
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 from bs4 import BeautifulSoup
 from curl_cffi.requests import AsyncSession
 
 from src import config
+from src.utils import kufar_cities
+from src.utils.ad import Ad
+from src.utils.rate_limiter import CircuitOpenError
 
-KUFAR_API_URL = "https://api.kufar.by/search-api/v2/search/rendered-paginated"
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
+KUFAR_API_URL = f"{config.KUFAR_API_BASE_URL}/search-api/v2/search/rendered-paginated"
 
-async def get_extended_ad_details(
-    session: AsyncSession, ad_link: str, ad_id: str
-) -> dict:
-    details = {
+DIV_TAG_RE = re.compile(r"<(/?)div\b", re.IGNORECASE)
+ADS_COUNT_RE = re.compile(r"Объявлений:\s*(\d+)")
+
+
+def get_empty_ad_details() -> dict:
+    return {
         "description": None,
         "seller_name": None,
         "seller_ads_count": None,
@@ -21,110 +32,144 @@ async def get_extended_ad_details(
         "phone_number": None,
     }
 
-    try:
-        response = await session.get(ad_link, impersonate="chrome110")
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        description_block = soup.find("div", attrs={"data-name": "description-block"})
-        if description_block:
-            description_text = description_block.get_text(strip=True, separator="\n")
-            if description_text.startswith("Описание"):
-                description_text = description_text[len("Описание") :].strip()
-            details["description"] = description_text
-            logging.info(f"HTML-парсер: Описание для {ad_id} найдено.")
-
-        seller_block = soup.find("div", attrs={"data-name": "seller-block"})
-        if seller_block:
-            seller_name_tag = seller_block.find("h5")
-            if seller_name_tag:
-                details["seller_name"] = seller_name_tag.get_text(strip=True)
+
+def extract_block_html(page_html: str, data_name: str) -> str | None:
+    marker = re.search(rf"data-name=[\"']{re.escape(data_name)}[\"']", page_html)
+    if not marker:
+        return None
+    start = page_html.rfind("<div", 0, marker.start())
+    if start == -1 or ">" in page_html[start : marker.start()]:
+        raise ValueError(f"Блок {data_name} находится не в теге div")
+    depth = 0
+    for tag in DIV_TAG_RE.finditer(page_html, start):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return page_html[start : page_html.find(">", tag.end()) + 1]
+    raise ValueError(f"Не найден конец блока {data_name}")
+
+
+def parse_detail_blocks(description_block, seller_block, ad_id: str) -> dict:
+    details = get_empty_ad_details()
+
+    if description_block:
+        description_text = description_block.get_text(strip=True, separator="\n")
+        if description_text.startswith("Описание"):
+            description_text = description_text[len("Описание") :].strip()
+        details["description"] = description_text
+        logging.info(f"HTML-парсер: Описание для {ad_id} найдено.")
+
+    if seller_block:
+        seller_name_tag = seller_block.find("h5")
+        if seller_name_tag:
+            details["seller_name"] = seller_name_tag.get_text(strip=True)
+            logging.info(
+                f"HTML-парсер: Имя продавца '{details['seller_name']}' найдено."
+            )
+
+        ads_count_p = seller_block.find(
+            lambda tag: tag.name == "p" and "Объявлений:" in tag.text
+        )
+        if ads_count_p:
+            match = ADS_COUNT_RE.search(ads_count_p.text)
+            if match:
+                details["seller_ads_count"] = int(match.group(1))
                 logging.info(
-                    f"HTML-парсер: Имя продавца '{details['seller_name']}' найдено."
+                    f"HTML-парсер: Кол-во объявлений '{details['seller_ads_count']}' найдено."
                 )
 
-            ads_count_p = seller_block.find(
-                lambda tag: tag.name == "p" and "Объявлений:" in tag.text
-            )
-            if ads_count_p:
-                match = re.search(r"Объявлений:\s*(\d+)", ads_count_p.text)
-                if match:
-                    details["seller_ads_count"] = int(match.group(1))
-                    logging.info(
-                        f"HTML-парсер: Кол-во объявлений '{details['seller_ads_count']}' найдено."
-                    )
-
-        if config.KUFAR_BEARER_TOKEN:
-            phone_url = f"https://api.kufar.by/search-api/v2/item/{ad_id}/phone"
-            headers = {
-                "Authorization": f"Bearer {config.KUFAR_BEARER_TOKEN}",
-                "Origin": "https://www.kufar.by",
-                "Referer": ad_link,
-            }
+    return details
+
+
+def parse_ad_page_full(page_html: str, ad_id: str) -> dict:
+    soup = BeautifulSoup(page_html, "html.parser")
+    return parse_detail_blocks(
+        soup.find("div", attrs={"data-name": "description-block"}),
+        soup.find("div", attrs={"data-name": "seller-block"}),
+        ad_id,
+    )
+
+
+def parse_ad_page(page_html: str, ad_id: str) -> dict:
+    # Only the two blocks we need are cut out of the page and parsed; the full
+    # tree is built only when the page markup does not look as expected.
+    try:
+        fragments = [
+            extract_block_html(page_html, "description-block"),
+            extract_block_html(page_html, "seller-block"),
+        ]
+    except ValueError as e:
+        logging.debug(f"Быстрый разбор страницы {ad_id} невозможен ({e}).")
+        return parse_ad_page_full(page_html, ad_id)
+    description_block, seller_block = (
+        BeautifulSoup(fragment, "html.parser").div if fragment else None
+        for fragment in fragments
+    )
+    return parse_detail_blocks(description_block, seller_block, ad_id)
+
+
+async def get_extended_ad_details(
+    session: AsyncSession, ad_link: str, ad_id: str
+) -> dict:
+    # A failed page load is raised to the caller, which must not cache empty
+    # details as the result; a missing phone number only leaves it out.
+    response = await session.get(ad_link, impersonate="chrome110")
+    response.raise_for_status()
+    details = parse_ad_page(response.text, ad_id)
+
+    if config.KUFAR_BEARER_TOKEN:
+        phone_url = f"{config.KUFAR_API_BASE_URL}/search-api/v2/item/{ad_id}/phone"
+        headers = {
+            "Authorization": f"Bearer {config.KUFAR_BEARER_TOKEN}",
+            "Origin": config.KUFAR_WEB_BASE_URL,
+            "Referer": ad_link,
+        }
+        try:
             phone_response = await session.get(
                 phone_url, headers=headers, impersonate="chrome110"
             )
             if phone_response.status_code == 200:
                 phone_data = phone_response.json()
                 details["phone_number"] = phone_data.get("phone")
-
-    except Exception as e:
-        logging.error(
-            f"Критическая ошибка при парсинге страницы объявления {ad_link}: {e}"
-        )
+        except CircuitOpenError as e:
+            logging.debug(f"Телефон для объявления {ad_id} не загружен: {e}")
+        except Exception as e:
+            logging.error(f"Ошибка при загрузке телефона объявления {ad_id}: {e}")
 
     return details
 
 
-def get_photo_url(ad: dict) -> str | None:
-    images = ad.get("images")
-    if not images:
+async def download_image(session: AsyncSession, url: str) -> bytes | None:
+    try:
+        response = await session.get(url, impersonate="chrome110")
+        response.raise_for_status()
+        return response.content
+    except Exception as e:
+        logging.error(f"Ошибка при загрузке изображения {url}: {e}")
         return None
-    if images[0].get("media_storage") == "rms":
-        path = images[0].get("path")
-        return f"https://rms.kufar.by/v1/gallery/{path}"
-    return None
-
 
-def get_ad_timestamp(ad: dict) -> datetime | None:
-    list_time = ad.get("list_time")
-    if list_time:
-        try:
-            return datetime.fromisoformat(list_time.replace("Z", "+00:00"))
-        except ValueError:
-            return None
-    return None
 
+def format_price(ad: Ad) -> str:
+    if ad.price_byn is None or ad.price_usd is None:
+        return "Цена не указана"
+    if ad.price_byn == 0:
+        return "договорная"
+    return f"{ad.price_byn} BYN / {ad.price_usd}$"
 
-def format_ad_message(ad: dict, extended_details: dict) -> str:
-    MAX_LENGTH = 1024
 
-    title = ad.get("subject", "Без заголовка")
+def format_location(ad: Ad) -> str:
+    return " / ".join(part for part in (ad.region_name, ad.area) if part)
 
-    try:
-        price_byn_val = int(ad.get("price_byn", "0"))
-        price_usd_val = int(ad.get("price_usd", "0"))
 
-        if price_byn_val == 0:
-            price_str = "договорная"
-        else:
-            price_str = f"{price_byn_val // 100} BYN / {price_usd_val // 100}$"
-    except (ValueError, TypeError):
-        price_str = "Цена не указана"
+def format_ad_message(ad: Ad, extended_details: dict, max_length: int = 1024) -> str:
+    title = ad.subject
+    price_str = format_price(ad)
 
     date_str = ""
-    dt_object_utc = get_ad_timestamp(ad)
-    if dt_object_utc:
-        local_dt = dt_object_utc + timedelta(hours=3)
+    if ad.timestamp:
+        local_dt = ad.timestamp + timedelta(hours=3)
         date_str = local_dt.strftime("%d.%m.%Y в %H:%M:%S")
 
-    region, area = "", ""
-    for param in ad.get("ad_parameters", []):
-        if param.get("p") == "region":
-            region = param.get("vl")
-        if param.get("p") == "area":
-            area = param.get("vl")
-    location_str = " / ".join(part for part in (region, area) if part)
+    location_str = format_location(ad)
 
     message_parts = [
         f"<b>{title}</b>",
@@ -154,7 +199,7 @@ def format_ad_message(ad: dict, extended_details: dict) -> str:
 
         description_title = "\n\n📋 <b>Описание:</b>\n"
 
-        remaining_length = MAX_LENGTH - len(header_text) - len(description_title)
+        remaining_length = max_length - len(header_text) - len(description_title)
 
         if len(safe_description) > remaining_length:
             truncated_desc = safe_description[: remaining_length - 3] + "..."
@@ -165,25 +210,83 @@ def format_ad_message(ad: dict, extended_details: dict) -> str:
     return "\n".join(message_parts)
 
 
-async def get_new_ads(session: AsyncSession, query_params: dict):
-    try:
-        params = query_params.copy()
-        params["size"] = params.pop("limit", 10)
-        if params.get("only_title_search"):
-            params["ot"] = 1
+def format_album_caption(ad: Ad, extended_details: dict) -> str:
+    # Photos in an album cannot carry buttons, so the link goes into the text.
+    link_line = f'\n\n<a href="{ad.link}">🔗 Смотреть на Kufar</a>'
+    return format_ad_message(ad, extended_details, 1024 - len(link_line)) + link_line
 
-        params.pop("only_title_search", None)
-        params.pop("city", None)
 
-        params.setdefault("lang", "ru")
-        params.setdefault("sort", "lst.d")
+def format_digest_message(ads: list) -> str:
+    lines = [f"🔔 <b>Новые объявления: {len(ads)}</b>"]
+    for number, ad in enumerate(ads, 1):
+        line = f'{number}. <a href="{ad.link}">{html.escape(ad.subject)}</a>'
+        line += f"\n<b>Цена:</b> {format_price(ad)}"
+        if location_str := format_location(ad):
+            line += f" · 📍 {location_str}"
+        lines.append(line)
+    return "\n\n".join(lines)
 
-        logging.debug(f"Отправка запроса на {KUFAR_API_URL} с параметрами: {params}")
-        response = await session.get(
-            KUFAR_API_URL, params=params, impersonate="chrome110"
-        )
-        response.raise_for_status()
-        return response.json().get("ads", [])
-    except Exception as e:
-        logging.error(f"Ошибка при запросе к Kufar API: {e}")
-        return []
+
+def build_search_params(query_params: dict) -> dict:
+    params = query_params.copy()
+    params["size"] = params.pop("limit", 10)
+    if params.get("only_title_search"):
+        params["ot"] = 1
+
+    params.pop("only_title_search", None)
+    params.update(kufar_cities.get_region_params(params.pop("city", None)))
+
+    params.setdefault("lang", "ru")
+    params.setdefault("sort", "lst.d")
+    return params
+
+
+def get_next_cursor(data: dict) -> str | None:
+    for page in data.get("pagination", {}).get("pages", []):
+        if page.get("label") == "next":
+            return page.get("token")
+    return None
+
+
+def decode_json(content: bytes):
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def parse_search_response(content: bytes) -> tuple[list, str | None]:
+    # Only the fields read by the bot are kept, the rest of every ad (seller
+    # parameters, attributes, the other photos) is dropped right after decoding.
+    data = decode_json(content)
+    return [Ad.from_api(ad) for ad in data.get("ads", [])], get_next_cursor(data)
+
+
+def get_conditional_headers(response) -> dict:
+    headers = {}
+    if etag := response.headers.get("ETag"):
+        headers["If-None-Match"] = etag
+    if last_modified := response.headers.get("Last-Modified"):
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+async def fetch_ads_page(
+    session: AsyncSession,
+    params: dict,
+    cursor: str | None = None,
+    conditional_headers: dict | None = None,
+) -> tuple[list | None, str | None, dict]:
+    if cursor:
+        params = {**params, "cursor": cursor}
+    logging.debug(f"Отправка запроса на {KUFAR_API_URL} с параметрами: {params}")
+    response = await session.get(
+        KUFAR_API_URL,
+        params=params,
+        headers=conditional_headers,
+        impersonate="chrome110",
+    )
+    if response.status_code == 304:
+        return None, None, conditional_headers
+    response.raise_for_status()
+    ads, next_cursor = parse_search_response(response.content)
+    return ads, next_cursor, get_conditional_headers(response)
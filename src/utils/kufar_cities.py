@@ -1,9 +1,37 @@
-CITIES = [
-    "Все города",
-    "Минск",
-    "Гомель",
-    "Могилев",
-    "Витебск",
-    "Гродно",
-    "Брест",
-]
+ALL_CITIES = "Все города"
+
+# Kufar search API region codes ("rgn"). Minsk is a region of its own, so the
+# server-side filter is exact; for oblast centers the region narrows results
+# to the oblast and the city is then matched by the ad's area name.
+CITY_LOCATIONS = {
+    ALL_CITIES: {},
+    "Минск": {"region": 7},
+    "Гомель": {"region": 2, "area": "Гомель"},
+    "Могилев": {"region": 4, "area": "Могилев"},
+    "Витебск": {"region": 6, "area": "Витебск"},
+    "Гродно": {"region": 3, "area": "Гродно"},
+    "Брест": {"region": 1, "area": "Брест"},
+}
+
+CITIES = list(CITY_LOCATIONS)
+
+
+def get_region_params(city_name: str) -> dict:
+    region = CITY_LOCATIONS.get(city_name, {}).get("region")
+    return {"rgn": region} if region else {}
+
+
+def needs_local_check(city_name: str, requested_city: str) -> bool:
+    location = CITY_LOCATIONS.get(city_name, {"area": city_name})
+    if not location:
+        return False
+    return requested_city != city_name or "area" in location
+
+
+def ad_matches_city(ad_region: str | None, ad_area: str, city_name: str) -> bool:
+    location = CITY_LOCATIONS.get(city_name, {"area": city_name})
+    if "region" in location and str(location["region"]) != str(ad_region):
+        return False
+    if "area" in location:
+        return location["area"] == ad_area.replace("ё", "е")
+    return True
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from curl_cffi import CurlOpt
+from curl_cffi.requests import AsyncSession
+from curl_cffi.requests.exceptions import ConnectionError, Timeout
+
+from src import config
+from src.utils import metrics
+from src.utils.rate_limiter import (
+    AdaptiveRateLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+
+WARM_UP_URLS = (
+    f"{config.KUFAR_API_BASE_URL}/",
+    f"{config.KUFAR_WEB_BASE_URL}/",
+    f"{config.KUFAR_MEDIA_BASE_URL}/",
+)
+
+REQUEST_KINDS = ("search", "ad_page", "phone")
+CIRCUIT_STATES = {
+    CircuitBreaker.CLOSED: 0,
+    CircuitBreaker.HALF_OPEN: 1,
+    CircuitBreaker.OPEN: 2,
+}
+
+
+def get_request_kind(method: str, url: str) -> str | None:
+    path = urlparse(url).path
+    if path.startswith("/search-api/v2/search"):
+        return "search"
+    if path.startswith("/search-api/v2/item/") and path.endswith("/phone"):
+        return "phone"
+    # Photos and connection warm-up are not limited.
+    if method == "GET" and path != "/" and not path.startswith("/v1/gallery/"):
+        return "ad_page"
+    return None
+
+
+def get_retry_after(response) -> float:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ThrottledSession:
+    # Wraps the shared session: search, ad page and phone requests go through
+    # one adaptive rate limit and a circuit breaker per request kind.
+    def __init__(
+        self,
+        session: AsyncSession,
+        limiter: AdaptiveRateLimiter,
+        breakers: dict,
+    ):
+        self._session = session
+        self.limiter = limiter
+        self.breakers = breakers
+
+    async def get(self, url: str, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def head(self, url: str, **kwargs):
+        return await self.request("HEAD", url, **kwargs)
+
+    async def request(self, method: str, url: str, **kwargs):
+        kind = get_request_kind(method, url)
+        if kind is None:
+            return await self._session.request(method, url, **kwargs)
+        breaker = self.breakers[kind]
+        if not breaker.allow():
+            raise CircuitOpenError(f"Запросы «{kind}» к Kufar временно приостановлены")
+        await self.limiter.acquire()
+        try:
+            response = await self._session.request(method, url, **kwargs)
+        except (Timeout, ConnectionError):
+            self.record_failure(kind, "timeout")
+            raise
+        if response.status_code == 429:
+            self.record_failure(kind, "rate_limited", get_retry_after(response))
+        elif response.status_code >= 500:
+            self.record_failure(kind, "server_error", get_retry_after(response))
+        else:
+            self.limiter.on_success()
+            breaker.record_success()
+            self.report(kind)
+        return response
+
+    def record_failure(self, kind: str, reason: str, retry_after: float = 0.0):
+        logging.debug(
+            f"Kufar замедляет запросы «{kind}»: {reason}, Retry-After {retry_after:.0f} сек."
+        )
+        self.limiter.on_throttle(retry_after)
+        self.breakers[kind].record_failure(retry_after)
+        metrics.kufar_throttled.inc(kind=kind, reason=reason)
+        self.report(kind)
+
+    def report(self, kind: str):
+        metrics.kufar_circuit_state.set(
+            CIRCUIT_STATES[self.breakers[kind].state], kind=kind
+        )
+
+    async def close(self):
+        await self._session.close()
+
+
+class KufarClient:
+    def __init__(
+        self,
+        max_connections: int,
+        connect_timeout: float,
+        request_timeout: float,
+        max_idle: int,
+        max_rate: float = 0.0,
+        min_rate: float = 0.0,
+        circuit_failures: int = 5,
+        circuit_cooldown: float = 60,
+    ):
+        self.max_connections = max(1, max_connections)
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self.max_idle = max_idle
+        self.limiter = AdaptiveRateLimiter(max_rate, min_rate)
+        self.breakers = {
+            kind: CircuitBreaker(kind, circuit_failures, circuit_cooldown)
+            for kind in REQUEST_KINDS
+        }
+        self._session = None
+        metrics.kufar_request_rate.set_function(lambda: self.limiter.rate)
+
+    @property
+    def session(self) -> ThrottledSession:
+        if self._session is None:
+            raise RuntimeError("KufarClient не запущен")
+        return self._session
+
+    async def start(self):
+        if self._session is not None:
+            return
+        session = AsyncSession(
+            max_clients=self.max_connections,
+            timeout=(self.connect_timeout, self.request_timeout),
+            impersonate="chrome110",
+            curl_options={
+                CurlOpt.TCP_KEEPALIVE: 1,
+                CurlOpt.TCP_KEEPIDLE: 30,
+                CurlOpt.TCP_KEEPINTVL: 15,
+                CurlOpt.MAXAGE_CONN: self.max_idle,
+            },
+        )
+        self._session = ThrottledSession(session, self.limiter, self.breakers)
+        for kind in REQUEST_KINDS:
+            self._session.report(kind)
+        await self.warm_up()
+
+    async def warm_up(self):
+        # TLS handshakes are done once at startup, so neither the first poll
+        # nor a user adding a query pays for them.
+        results = await asyncio.gather(
+            *(self._session.head(url) for url in WARM_UP_URLS),
+            return_exceptions=True,
+        )
+        for url, result in zip(WARM_UP_URLS, results):
+            if isinstance(result, Exception):
+                logging.warning(f"Не удалось установить соединение с {url}: {result}")
+            else:
+                logging.debug(f"Соединение с {url} установлено.")
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+def create_kufar_client(processes: int = 1) -> KufarClient:
+    # Polling processes share the request rate evenly.
+    return KufarClient(
+        max_connections=config.KUFAR_MAX_CONNECTIONS,
+        connect_timeout=config.KUFAR_CONNECT_TIMEOUT,
+        request_timeout=config.KUFAR_REQUEST_TIMEOUT,
+        max_idle=config.KUFAR_CONNECTION_MAX_IDLE,
+        max_rate=config.KUFAR_REQUESTS_PER_SECOND / processes,
+        min_rate=config.KUFAR_MIN_REQUESTS_PER_SECOND / processes,
+        circuit_failures=config.KUFAR_CIRCUIT_FAILURES,
+        circuit_cooldown=config.KUFAR_CIRCUIT_COOLDOWN,
+    )
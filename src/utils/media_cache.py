@@ -0,0 +1,50 @@
+import asyncio
+import logging
+
+from curl_cffi.requests import AsyncSession
+
+from src.utils import kufar_api
+from src.utils.cache import TTLCache
+
+FILE_ID_TTL = 24 * 60 * 60
+DOWNLOAD_TTL = 5 * 60
+
+
+class MediaCache:
+    def __init__(self, max_size: int, session: AsyncSession | None = None):
+        self.session = session
+        self._file_ids = TTLCache(max_size, FILE_ID_TTL)
+        # Downloaded bytes are kept briefly in case the first upload fails and
+        # the next recipient has to upload the image again.
+        self._downloads = TTLCache(32, DOWNLOAD_TTL)
+        self._locks = {}
+
+    def get_file_id(self, url: str) -> str | None:
+        return self._file_ids.get(url)
+
+    def remember(self, url: str, file_id: str):
+        self._file_ids.set(url, file_id)
+        self._downloads.set(url, None)
+
+    def lock_for(self, url: str) -> asyncio.Lock:
+        lock = self._locks.get(url)
+        if lock is None:
+            lock = self._locks[url] = asyncio.Lock()
+        return lock
+
+    def release(self, url: str):
+        lock = self._locks.get(url)
+        if lock is not None and not lock.locked():
+            del self._locks[url]
+
+    async def download(self, url: str) -> bytes | None:
+        if (content := self._downloads.get(url)) is not None:
+            return content
+        if self.session is None:
+            return None
+        content = await kufar_api.download_image(self.session, url)
+        if content:
+            self._downloads.set(url, content)
+        else:
+            logging.warning(f"Не удалось скачать фото {url}, отправляем ссылкой.")
+        return content
@@ -0,0 +1,302 @@
+import logging
+import math
+
+from aiohttp import web
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+API_DELAY_BUCKETS = (10, 30, 60, 120, 240, 600, 1800, 3600)
+
+
+def format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def state(self) -> dict:
+        return dict(self._values)
+
+    def merge(self, states: list) -> dict:
+        merged = {}
+        for state in states:
+            for key, value in state.items():
+                merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def samples(self, state: dict):
+        for key, value in state.items():
+            yield self.name, format_labels(self.labelnames, key), value
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        combine=sum,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        # How values of the same gauge from several processes are combined.
+        self.combine = combine
+        self.value = 0
+        self._values = {}
+        self._function = None
+
+    def set(self, value: float, **labels):
+        if self.labelnames:
+            key = tuple(labels.get(name, "") for name in self.labelnames)
+            self._values[key] = value
+        else:
+            self.value = value
+
+    def set_function(self, function):
+        self._function = function
+
+    def state(self) -> dict:
+        if self.labelnames:
+            return dict(self._values)
+        return {(): self._function() if self._function else self.value}
+
+    def merge(self, states: list) -> dict:
+        values = {}
+        for state in states:
+            for key, value in state.items():
+                values.setdefault(key, []).append(value)
+        return {key: self.combine(key_values) for key, key_values in values.items()}
+
+    def samples(self, state: dict):
+        for key, value in state.items():
+            yield self.name, format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._values = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        counts = state[0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        state[1] += value
+        state[2] += 1
+
+    def state(self) -> dict:
+        return {
+            key: [list(counts), total, count]
+            for key, (counts, total, count) in self._values.items()
+        }
+
+    def merge(self, states: list) -> dict:
+        merged = {}
+        for state in states:
+            for key, (counts, total, count) in state.items():
+                if key not in merged:
+                    merged[key] = [list(counts), total, count]
+                    continue
+                merged_state = merged[key]
+                merged_state[0] = [a + b for a, b in zip(merged_state[0], counts)]
+                merged_state[1] += total
+                merged_state[2] += count
+        return merged
+
+    def samples(self, state: dict):
+        for key, (counts, total, count) in state.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{format_value(bound)}"'
+                yield (
+                    f"{self.name}_bucket",
+                    format_labels(self.labelnames, key, le),
+                    cumulative,
+                )
+            labels = format_labels(self.labelnames, key)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        # Latest snapshots sent by other processes (the polling workers),
+        # exported together with the values of this process.
+        self._sources = {}
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collect(self) -> dict:
+        return {metric.name: metric.state() for metric in self._metrics}
+
+    def update_source(self, source, snapshot: dict):
+        self._sources[source] = snapshot
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            states = [metric.state()] + [
+                snapshot[metric.name]
+                for snapshot in self._sources.values()
+                if metric.name in snapshot
+            ]
+            for name, labels, value in metric.samples(metric.merge(states)):
+                lines.append(f"{name}{labels} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+kufar_search_requests = registry.register(
+    Counter(
+        "kufar_search_requests_total",
+        "Kufar search requests by result.",
+        ("result",),
+    )
+)
+kufar_search_duration = registry.register(
+    Histogram("kufar_search_duration_seconds", "Kufar search request latency.")
+)
+enrichment_requests = registry.register(
+    Counter(
+        "kufar_enrichment_total",
+        "Ad page enrichments by result.",
+        ("result",),
+    )
+)
+enrichment_duration = registry.register(
+    Histogram("kufar_enrichment_duration_seconds", "Ad page enrichment latency.")
+)
+telegram_sends = registry.register(
+    Counter(
+        "telegram_sends_total",
+        "Telegram notification send attempts by result.",
+        ("result",),
+    )
+)
+telegram_send_duration = registry.register(
+    Histogram("telegram_send_duration_seconds", "Telegram send latency.")
+)
+query_check_duration = registry.register(
+    Histogram(
+        "poll_query_check_duration_seconds",
+        "Duration of one search check, from request to notifications queued.",
+    )
+)
+new_ads_found = registry.register(
+    Counter("poll_new_ads_total", "New ads found by the poller.")
+)
+api_delay = registry.register(
+    Histogram(
+        "kufar_api_delay_seconds",
+        "Delay between the ad list_time and its discovery by the poller.",
+        buckets=API_DELAY_BUCKETS,
+    )
+)
+delivery_queue_size = registry.register(
+    Gauge("delivery_queue_size", "Notifications waiting to be sent.")
+)
+digest_pending_ads = registry.register(
+    Gauge("delivery_digest_pending_ads", "Ads waiting for their digest to be sent.")
+)
+digest_ads = registry.register(
+    Counter(
+        "delivery_digest_ads_total",
+        "Ads sent to users in digests, by digest mode.",
+        ("mode",),
+    )
+)
+checks_in_flight = registry.register(
+    Gauge("poll_checks_in_flight", "Search checks running right now.")
+)
+scheduled_searches = registry.register(
+    Gauge("poll_scheduled_searches", "Coalesced searches in the polling schedule.")
+)
+seen_ads_size = registry.register(
+    Gauge("seen_ads_size", "Ad IDs held in the seen-ad store.")
+)
+kufar_request_rate = registry.register(
+    Gauge("kufar_request_rate", "Current adaptive limit on Kufar requests per second.")
+)
+kufar_throttled = registry.register(
+    Counter(
+        "kufar_throttled_total",
+        "Kufar responses that slowed requests down, by request kind and reason.",
+        ("kind", "reason"),
+    )
+)
+kufar_circuit_state = registry.register(
+    Gauge(
+        "kufar_circuit_state",
+        "Circuit breaker per Kufar request kind: 0 closed, 1 half-open, 2 open.",
+        ("kind",),
+        combine=max,
+    )
+)
+cluster_owned_searches = registry.register(
+    Gauge("cluster_owned_searches", "Coalesced searches leased by this node.")
+)
+cluster_live_nodes = registry.register(
+    Gauge("cluster_live_nodes", "Nodes with a recent heartbeat in the cluster.")
+)
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(
+        text=registry.render(), content_type="text/plain", charset="utf-8"
+    )
+
+
+async def start_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
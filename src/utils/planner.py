@@ -0,0 +1,86 @@
+import hashlib
+
+from src.utils import kufar_cities
+from src.utils.ad import Ad
+from src.utils.kufar_cities import ALL_CITIES
+
+DEFAULT_LIMIT = 10
+
+
+def get_group_key(query_key: frozenset) -> frozenset:
+    query_params = dict(query_key)
+    return frozenset(
+        {
+            "query": query_params.get("query"),
+            "only_title_search": bool(query_params.get("only_title_search")),
+        }.items()
+    )
+
+
+def get_group_id(group_key: frozenset) -> str:
+    # hash() of a str is salted per process, so a digest keeps the ID stable
+    # across restarts, processes and nodes.
+    return hashlib.blake2b(
+        repr(sorted(group_key, key=repr)).encode(), digest_size=8
+    ).hexdigest()
+
+
+def build_plan(query_keys) -> dict:
+    plan = {}
+    for query_key in query_keys:
+        plan.setdefault(get_group_key(query_key), []).append(query_key)
+    return plan
+
+
+def get_group_params(member_keys: list) -> dict:
+    members = [dict(query_key) for query_key in member_keys]
+    params = dict(members[0])
+    params.pop("price_min", None)
+    params.pop("price_max", None)
+    params["limit"] = max(query.get("limit", DEFAULT_LIMIT) for query in members)
+
+    cities = {query.get("city", ALL_CITIES) for query in members}
+    params["city"] = cities.pop() if len(cities) == 1 else ALL_CITIES
+
+    # A bound can only be sent to Kufar when every member has one,
+    # otherwise the widest (unbounded) range is requested.
+    if all("price_min" in query for query in members):
+        params["price_min"] = min(query["price_min"] for query in members)
+    if all("price_max" in query for query in members):
+        params["price_max"] = max(query["price_max"] for query in members)
+    return params
+
+
+def matches_query(ad: Ad, query_params: dict, requested_city: str) -> bool:
+    city_name = query_params.get("city", ALL_CITIES)
+    if kufar_cities.needs_local_check(city_name, requested_city):
+        if not kufar_cities.ad_matches_city(ad.region, ad.area, city_name):
+            return False
+
+    price_min = query_params.get("price_min")
+    price_max = query_params.get("price_max")
+    if price_min is not None or price_max is not None:
+        price_byn = ad.price_byn
+        if price_byn is None:
+            return False
+        if price_min is not None and price_byn < price_min:
+            return False
+        if price_max is not None and price_byn > price_max:
+            return False
+    return True
+
+
+def filter_ads_for_query(
+    ads: list,
+    query_params: dict,
+    requested_city: str = ALL_CITIES,
+    use_limit: bool = True,
+) -> list:
+    limit = query_params.get("limit", DEFAULT_LIMIT) if use_limit else len(ads)
+    matched = []
+    for ad in ads:
+        if len(matched) >= limit:
+            break
+        if matches_query(ad, query_params, requested_city):
+            matched.append(ad)
+    return matched
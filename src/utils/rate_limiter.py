@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+
+    def try_acquire(self) -> float:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def acquire(self):
+        while wait := self.try_acquire():
+            await asyncio.sleep(wait)
+
+
+class AdaptiveRateLimiter:
+    # AIMD: every successful request raises the rate by a small step, every
+    # throttling signal halves it, so the rate settles just below the point
+    # where the server starts pushing back.
+    def __init__(
+        self,
+        max_rate: float,
+        min_rate: float,
+        increase_step: float | None = None,
+        decrease_factor: float = 0.5,
+    ):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate) if max_rate > 0 else min_rate
+        self.increase_step = increase_step or max(max_rate, 1) / 50
+        self.decrease_factor = decrease_factor
+        self.rate = max_rate
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._decreased_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def paused_for(self) -> float:
+        return max(0.0, self._paused_until - time.monotonic())
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._paused_until)
+            if self.rate > 0:
+                slot = max(slot, self._next_slot)
+                self._next_slot = slot + 1 / self.rate
+        wait = slot - now
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        if self.max_rate > 0:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttle(self, retry_after: float = 0.0):
+        now = time.monotonic()
+        if retry_after > 0:
+            self._paused_until = max(self._paused_until, now + retry_after)
+        if self.max_rate <= 0:
+            return
+        # Requests already in flight fail together; they count as one signal.
+        if now - self._decreased_at >= max(1.0, 1 / self.rate):
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self._decreased_at = now
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+
+    def __init__(self, name: str, failure_threshold: int, cooldown: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self._retry_at = 0.0
+
+    def is_open(self) -> bool:
+        return self.state != self.CLOSED and time.monotonic() < self._retry_at
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        # A single trial request checks whether the service has recovered;
+        # if it never reports back, another one is let through after the
+        # next cooldown.
+        self.state = self.HALF_OPEN
+        self._retry_at = now + self.cooldown
+        return True
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logging.info(f"Запросы «{self.name}» к Kufar снова проходят.")
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self, retry_after: float = 0.0):
+        self.failures += 1
+        if self.state == self.CLOSED and self.failures < self.failure_threshold:
+            return
+        pause = max(self.cooldown, retry_after)
+        if self.state == self.CLOSED:
+            logging.warning(
+                f"Запросы «{self.name}» к Kufar приостановлены на {pause:.0f} сек. "
+                f"после {self.failures} ошибок подряд."
+            )
+        self.state = self.OPEN
+        self._retry_at = time.monotonic() + pause
@@ -0,0 +1,127 @@
+import logging
+
+
+def get_query_key(query: dict) -> frozenset:
+    return frozenset((key, value) for key, value in query.items() if key != "id")
+
+
+class Registry:
+    def __init__(self, storage):
+        self.storage = storage
+        self._listeners = []
+        self._load()
+        logging.info(
+            f"Реестр загружен: {len(self.users)} пользователей, "
+            f"{len(self._subscribers)} уникальных запросов."
+        )
+
+    def _load(self):
+        self.users = dict.fromkeys(self.storage.load_users())
+        self._settings = self.storage.load_user_settings()
+        self._queries = {}
+        self._subscribers = {}
+        for user_id, user_queries in self.storage.load_queries().items():
+            for query in user_queries:
+                self._index_query(int(user_id), query)
+
+    def reload(self) -> bool:
+        # Picks up users and queries written to shared storage by other nodes.
+        unique_queries = set(self._subscribers)
+        self._load()
+        if set(self._subscribers) == unique_queries:
+            return False
+        self._notify()
+        return True
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def is_user(self, user_id: int) -> bool:
+        return user_id in self.users
+
+    def add_user(self, user_id: int) -> bool:
+        if user_id in self.users:
+            return False
+        self.storage.add_user(user_id)
+        self.users[user_id] = None
+        return True
+
+    def remove_user(self, user_id: int) -> bool:
+        if user_id not in self.users:
+            return False
+        self.storage.remove_user(user_id)
+        del self.users[user_id]
+        return True
+
+    def get_user_settings(self, user_id: int) -> dict:
+        return dict(self._settings.get(user_id, {}))
+
+    def update_user_settings(self, user_id: int, changes: dict) -> dict:
+        settings = self.storage.update_user_settings(user_id, changes)
+        self._settings[user_id] = settings
+        return dict(settings)
+
+    def get_user_queries(self, user_id: int) -> list:
+        return [dict(query) for query in self._queries.get(user_id, {}).values()]
+
+    def get_query(self, user_id: int, query_id: int) -> dict | None:
+        query = self._queries.get(user_id, {}).get(query_id)
+        return dict(query) if query else None
+
+    def add_query(self, user_id: int, query: dict) -> dict:
+        query = self.storage.add_query(user_id, query)
+        self._index_query(user_id, query)
+        self._notify()
+        return dict(query)
+
+    def update_query(
+        self, user_id: int, query_id: int, changes: dict, removed_keys=()
+    ) -> dict | None:
+        if query_id not in self._queries.get(user_id, {}):
+            return None
+        query = self.storage.update_query(user_id, query_id, changes, removed_keys)
+        if query is None:
+            return None
+        self._unindex_query(user_id, query_id)
+        self._index_query(user_id, query)
+        self._notify()
+        return dict(query)
+
+    def delete_query(self, user_id: int, query_id: int) -> dict | None:
+        if query_id not in self._queries.get(user_id, {}):
+            return None
+        query = self.storage.delete_query(user_id, query_id)
+        self._unindex_query(user_id, query_id)
+        self._notify()
+        return query
+
+    def unique_queries(self) -> list:
+        return list(self._subscribers)
+
+    def get_subscribers(self, query_key: frozenset) -> list:
+        return list(self._subscribers.get(query_key, ()))
+
+    def _index_query(self, user_id: int, query: dict):
+        self._queries.setdefault(user_id, {})[query["id"]] = query
+        subscribers = self._subscribers.setdefault(get_query_key(query), {})
+        # Reference count per user: the same user may save identical queries.
+        subscribers[user_id] = subscribers.get(user_id, 0) + 1
+
+    def _unindex_query(self, user_id: int, query_id: int):
+        query = self._queries[user_id].pop(query_id)
+        if not self._queries[user_id]:
+            del self._queries[user_id]
+        query_key = get_query_key(query)
+        subscribers = self._subscribers[query_key]
+        subscribers[user_id] -= 1
+        if not subscribers[user_id]:
+            del subscribers[user_id]
+        if not subscribers:
+            del self._subscribers[query_key]
+
+    def _notify(self):
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"Ошибка в обработчике изменений реестра: {e}")
@@ -0,0 +1,84 @@
+import heapq
+import itertools
+import random
+import time
+
+
+class QueryScheduler:
+    def __init__(
+        self,
+        min_interval: float,
+        max_interval: float,
+        initial_interval: float,
+        speedup_factor: float = 0.5,
+        backoff_factor: float = 1.5,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.initial_interval = min(max(initial_interval, min_interval), max_interval)
+        self.speedup_factor = speedup_factor
+        self.backoff_factor = backoff_factor
+        self._heap = []
+        self._counter = itertools.count()
+        self._due = {}
+        self._intervals = {}
+        self._in_flight = set()
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def sync(self, keys, now: float | None = None):
+        now = time.monotonic() if now is None else now
+        keys = set(keys)
+        for key in list(self._intervals):
+            if key not in keys:
+                del self._intervals[key]
+                self._due.pop(key, None)
+                self._in_flight.discard(key)
+        for key in keys:
+            if key not in self._intervals:
+                self._intervals[key] = self.initial_interval
+                # Spread new queries over their first interval instead of
+                # firing all of them at the same moment.
+                self._push(key, now + random.uniform(0, self.initial_interval))
+
+    def pop_due(self, now: float | None = None) -> list:
+        now = time.monotonic() if now is None else now
+        due_keys = []
+        while self._heap and self._heap[0][0] <= now:
+            due_time, _, key = heapq.heappop(self._heap)
+            if self._due.get(key) != due_time:
+                continue
+            del self._due[key]
+            self._in_flight.add(key)
+            due_keys.append(key)
+        return due_keys
+
+    def reschedule(self, key, new_ads_count: int, now: float | None = None):
+        now = time.monotonic() if now is None else now
+        if key not in self._intervals:
+            return
+        self._in_flight.discard(key)
+        interval = self._intervals[key]
+        if new_ads_count > 0:
+            interval *= self.speedup_factor
+        else:
+            interval *= self.backoff_factor
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        self._intervals[key] = interval
+        self._push(key, now + interval)
+
+    def interval_for(self, key) -> float | None:
+        return self._intervals.get(key)
+
+    def seconds_until_next(self, now: float | None = None) -> float | None:
+        now = time.monotonic() if now is None else now
+        while self._heap and self._due.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - now)
+
+    def _push(self, key, due_time: float):
+        self._due[key] = due_time
+        heapq.heappush(self._heap, (due_time, next(self._counter), key))
@@ -0,0 +1,103 @@
+import time
+
+
+class SeenAdStore:
+    def __init__(self, ttl_seconds: float, max_size: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max(1, max_size)
+        self._seen_at = {}
+        self._added = set()
+        self._touched = set()
+        self._removed = set()
+
+    def __contains__(self, ad_id) -> bool:
+        return ad_id in self._seen_at
+
+    def __len__(self) -> int:
+        return len(self._seen_at)
+
+    @property
+    def unsaved_count(self) -> int:
+        return len(self._added) + len(self._touched) + len(self._removed)
+
+    def add(self, ad_id, seen_at: float | None = None):
+        if ad_id is None:
+            return
+        if ad_id not in self._seen_at:
+            self._added.add(ad_id)
+            self._removed.discard(ad_id)
+        elif ad_id not in self._added:
+            self._touched.add(ad_id)
+        self._seen_at[ad_id] = time.time() if seen_at is None else seen_at
+        if len(self._seen_at) > self.max_size:
+            # Trim a little below the cap so the sort is not repeated on every add.
+            self._trim(int(self.max_size * 0.9))
+
+    def update(self, ad_ids, seen_at: float | None = None):
+        seen_at = time.time() if seen_at is None else seen_at
+        for ad_id in ad_ids:
+            self.add(ad_id, seen_at)
+
+    def touch(self, ad_id, seen_at: float | None = None):
+        # Ads that still show up in search results must outlive the TTL,
+        # otherwise a rarely updated query would notify them again.
+        if ad_id in self._seen_at:
+            self._seen_at[ad_id] = time.time() if seen_at is None else seen_at
+            # The refreshed time is saved too, or the ad would be evicted as
+            # expired when the store is loaded after a restart.
+            if ad_id not in self._added:
+                self._touched.add(ad_id)
+
+    def evict_expired(self, now: float | None = None) -> int:
+        now = time.time() if now is None else now
+        threshold = now - self.ttl_seconds
+        expired = [ad_id for ad_id, ts in self._seen_at.items() if ts < threshold]
+        for ad_id in expired:
+            self._remove(ad_id)
+        return len(expired)
+
+    def to_records(self) -> list:
+        return [[ad_id, round(ts)] for ad_id, ts in self._seen_at.items()]
+
+    def load_records(self, records, now: float | None = None):
+        now = time.time() if now is None else now
+        for record in records:
+            # Older cache files contain bare ad IDs without a timestamp.
+            if isinstance(record, (list, tuple)) and len(record) == 2:
+                ad_id, seen_at = record
+            else:
+                ad_id, seen_at = record, now
+            self._seen_at[ad_id] = seen_at
+        self._added.clear()
+        self._touched.clear()
+        self.evict_expired(now)
+        if len(self._seen_at) > self.max_size:
+            self._trim(self.max_size)
+
+    def pop_changes(self) -> tuple[list, list]:
+        added = [
+            [ad_id, round(self._seen_at[ad_id])]
+            for ad_id in self._added | self._touched
+            if ad_id in self._seen_at
+        ]
+        removed = list(self._removed)
+        self._added.clear()
+        self._touched.clear()
+        self._removed.clear()
+        return added, removed
+
+    def _remove(self, ad_id):
+        del self._seen_at[ad_id]
+        self._touched.discard(ad_id)
+        if ad_id in self._added:
+            self._added.discard(ad_id)
+        else:
+            self._removed.add(ad_id)
+
+    def _trim(self, target_size: int):
+        excess = len(self._seen_at) - target_size
+        if excess <= 0:
+            return
+        oldest = sorted(self._seen_at, key=self._seen_at.__getitem__)[:excess]
+        for ad_id in oldest:
+            self._remove(ad_id)
@@ -0,0 +1,342 @@
+import json
+import logging
+import os
+import sqlite3
+
+from src.utils.seen_ads import SeenAdStore
+from src.utils.watermarks import WatermarkStore
+
+
+class JsonStorage:
+    def __init__(
+        self,
+        users_file: str,
+        queries_file: str,
+        cached_ads_file: str,
+        watermarks_file: str,
+        user_settings_file: str,
+    ):
+        self.users_file = users_file
+        self.queries_file = queries_file
+        self.cached_ads_file = cached_ads_file
+        self.watermarks_file = watermarks_file
+        self.user_settings_file = user_settings_file
+
+    def load_json(self, filename, default_value):
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        try:
+            with open(filename, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return default_value
+
+    def save_json(self, filename, data, indent=4):
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=indent, ensure_ascii=False)
+
+    def load_users(self) -> list:
+        return self.load_json(self.users_file, [])
+
+    def add_user(self, user_id: int) -> bool:
+        users = self.load_users()
+        if user_id in users:
+            return False
+        users.append(user_id)
+        self.save_json(self.users_file, users)
+        return True
+
+    def remove_user(self, user_id: int) -> bool:
+        users = self.load_users()
+        if user_id not in users:
+            return False
+        users.remove(user_id)
+        self.save_json(self.users_file, users)
+        return True
+
+    def load_user_settings(self) -> dict:
+        return {
+            int(user_id): settings
+            for user_id, settings in self.load_json(self.user_settings_file, {}).items()
+        }
+
+    def update_user_settings(self, user_id: int, changes: dict) -> dict:
+        all_settings = self.load_json(self.user_settings_file, {})
+        settings = all_settings.setdefault(str(user_id), {})
+        settings.update(changes)
+        self.save_json(self.user_settings_file, all_settings)
+        return settings
+
+    def load_queries(self) -> dict:
+        all_queries = self.load_json(self.queries_file, {})
+        # Queries saved before stable IDs existed get them on first load.
+        next_id = 1 + max(
+            (
+                query.get("id", 0)
+                for user_queries in all_queries.values()
+                for query in user_queries
+            ),
+            default=0,
+        )
+        ids_assigned = False
+        for user_queries in all_queries.values():
+            for query in user_queries:
+                if "id" not in query:
+                    query["id"] = next_id
+                    next_id += 1
+                    ids_assigned = True
+        if ids_assigned:
+            self.save_json(self.queries_file, all_queries)
+        return all_queries
+
+    def add_query(self, user_id: int, query: dict) -> dict:
+        all_queries = self.load_queries()
+        next_id = 1 + max(
+            (q["id"] for user_queries in all_queries.values() for q in user_queries),
+            default=0,
+        )
+        query = {**query, "id": next_id}
+        all_queries.setdefault(str(user_id), []).append(query)
+        self.save_json(self.queries_file, all_queries)
+        return query
+
+    def update_query(
+        self, user_id: int, query_id: int, changes: dict, removed_keys=()
+    ) -> dict | None:
+        all_queries = self.load_queries()
+        for query in all_queries.get(str(user_id), []):
+            if query["id"] == query_id:
+                query.update(changes)
+                for key in removed_keys:
+                    query.pop(key, None)
+                self.save_json(self.queries_file, all_queries)
+                return query
+        return None
+
+    def delete_query(self, user_id: int, query_id: int) -> dict | None:
+        all_queries = self.load_queries()
+        user_queries = all_queries.get(str(user_id), [])
+        for i, query in enumerate(user_queries):
+            if query["id"] == query_id:
+                del user_queries[i]
+                if not user_queries:
+                    del all_queries[str(user_id)]
+                self.save_json(self.queries_file, all_queries)
+                return query
+        return None
+
+    def load_seen_ads(self, seen_ads: SeenAdStore):
+        seen_ads.load_records(self.load_json(self.cached_ads_file, []))
+
+    def save_seen_ads(self, seen_ads: SeenAdStore):
+        seen_ads.pop_changes()
+        self.save_json(self.cached_ads_file, seen_ads.to_records(), indent=None)
+
+    def load_watermarks(self, watermarks: WatermarkStore):
+        watermarks.load_records(self.load_json(self.watermarks_file, []))
+
+    def save_watermarks(self, watermarks: WatermarkStore):
+        watermarks.pop_changes()
+        self.save_json(self.watermarks_file, watermarks.to_records(), indent=None)
+
+
+class SqliteStorage:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS user_settings (
+            user_id INTEGER PRIMARY KEY,
+            params TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS queries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            params TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_queries_user_id ON queries (user_id);
+        CREATE TABLE IF NOT EXISTS seen_ads (
+            ad_id INTEGER PRIMARY KEY,
+            seen_at INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_seen_ads_seen_at ON seen_ads (seen_at);
+        CREATE TABLE IF NOT EXISTS watermarks (
+            group_id TEXT PRIMARY KEY,
+            list_time TEXT NOT NULL,
+            ad_ids TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, db_file: str):
+        os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(db_file, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+    def migrate_from_json(self, json_storage: JsonStorage):
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone():
+            return
+        users = json_storage.load_users()
+        user_settings = json_storage.load_user_settings()
+        all_queries = json_storage.load_queries()
+        seen_ads_records = json_storage.load_json(json_storage.cached_ads_file, [])
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO users (user_id) VALUES (?)",
+                [(user_id,) for user_id in users],
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO user_settings (user_id, params) VALUES (?, ?)",
+                [
+                    (user_id, json.dumps(settings, ensure_ascii=False))
+                    for user_id, settings in user_settings.items()
+                ],
+            )
+            for user_id, user_queries in all_queries.items():
+                for query in user_queries:
+                    params = {k: v for k, v in query.items() if k != "id"}
+                    self.conn.execute(
+                        "INSERT OR IGNORE INTO queries (id, user_id, params) VALUES (?, ?, ?)",
+                        (
+                            query["id"],
+                            int(user_id),
+                            json.dumps(params, ensure_ascii=False),
+                        ),
+                    )
+            seen_ads = SeenAdStore(
+                ttl_seconds=float("inf"), max_size=len(seen_ads_records) + 1
+            )
+            seen_ads.load_records(seen_ads_records)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO seen_ads (ad_id, seen_at) VALUES (?, ?)",
+                seen_ads.to_records(),
+            )
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('migrated', '1')")
+        logging.info(
+            f"Данные перенесены из JSON в SQLite: {len(users)} пользователей, "
+            f"{sum(len(q) for q in all_queries.values())} запросов, "
+            f"{len(seen_ads_records)} ID объявлений."
+        )
+
+    def load_users(self) -> list:
+        rows = self.conn.execute("SELECT user_id FROM users ORDER BY rowid")
+        return [user_id for (user_id,) in rows]
+
+    def add_user(self, user_id: int) -> bool:
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,)
+        )
+        return cursor.rowcount > 0
+
+    def remove_user(self, user_id: int) -> bool:
+        cursor = self.conn.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+        return cursor.rowcount > 0
+
+    def load_user_settings(self) -> dict:
+        rows = self.conn.execute("SELECT user_id, params FROM user_settings")
+        return {user_id: json.loads(params) for user_id, params in rows}
+
+    def update_user_settings(self, user_id: int, changes: dict) -> dict:
+        row = self.conn.execute(
+            "SELECT params FROM user_settings WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        settings = {**(json.loads(row[0]) if row else {}), **changes}
+        self.conn.execute(
+            "INSERT OR REPLACE INTO user_settings (user_id, params) VALUES (?, ?)",
+            (user_id, json.dumps(settings, ensure_ascii=False)),
+        )
+        return settings
+
+    def load_queries(self) -> dict:
+        all_queries = {}
+        rows = self.conn.execute("SELECT id, user_id, params FROM queries ORDER BY id")
+        for query_id, user_id, params in rows:
+            all_queries.setdefault(str(user_id), []).append(
+                {**json.loads(params), "id": query_id}
+            )
+        return all_queries
+
+    def _get_query(self, user_id: int, query_id: int) -> dict | None:
+        row = self.conn.execute(
+            "SELECT params FROM queries WHERE id = ? AND user_id = ?",
+            (query_id, user_id),
+        ).fetchone()
+        if row is None:
+            return None
+        return {**json.loads(row[0]), "id": query_id}
+
+    def add_query(self, user_id: int, query: dict) -> dict:
+        params = {k: v for k, v in query.items() if k != "id"}
+        cursor = self.conn.execute(
+            "INSERT INTO queries (user_id, params) VALUES (?, ?)",
+            (user_id, json.dumps(params, ensure_ascii=False)),
+        )
+        return {**params, "id": cursor.lastrowid}
+
+    def update_query(
+        self, user_id: int, query_id: int, changes: dict, removed_keys=()
+    ) -> dict | None:
+        query = self._get_query(user_id, query_id)
+        if query is None:
+            return None
+        query.update(changes)
+        for key in removed_keys:
+            query.pop(key, None)
+        params = {k: v for k, v in query.items() if k != "id"}
+        self.conn.execute(
+            "UPDATE queries SET params = ? WHERE id = ?",
+            (json.dumps(params, ensure_ascii=False), query_id),
+        )
+        return query
+
+    def delete_query(self, user_id: int, query_id: int) -> dict | None:
+        query = self._get_query(user_id, query_id)
+        if query is None:
+            return None
+        self.conn.execute("DELETE FROM queries WHERE id = ?", (query_id,))
+        return query
+
+    def load_seen_ads(self, seen_ads: SeenAdStore):
+        seen_ads.load_records(self.conn.execute("SELECT ad_id, seen_at FROM seen_ads"))
+
+    def save_seen_ads(self, seen_ads: SeenAdStore):
+        added, removed = seen_ads.pop_changes()
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO seen_ads (ad_id, seen_at) VALUES (?, ?)", added
+            )
+            self.conn.executemany(
+                "DELETE FROM seen_ads WHERE ad_id = ?",
+                [(ad_id,) for ad_id in removed],
+            )
+
+    def load_watermarks(self, watermarks: WatermarkStore):
+        rows = self.conn.execute("SELECT group_id, list_time, ad_ids FROM watermarks")
+        watermarks.load_records(
+            (group_id, list_time, json.loads(ad_ids))
+            for group_id, list_time, ad_ids in rows
+        )
+
+    def save_watermarks(self, watermarks: WatermarkStore):
+        updated, removed = watermarks.pop_changes()
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO watermarks (group_id, list_time, ad_ids) "
+                "VALUES (?, ?, ?)",
+                [
+                    (group_id, list_time, json.dumps(ad_ids))
+                    for group_id, list_time, ad_ids in updated
+                ],
+            )
+            self.conn.executemany(
+                "DELETE FROM watermarks WHERE group_id = ?",
+                [(group_id,) for group_id in removed],
+            )
@@ -0,0 +1,57 @@
+class WatermarkStore:
+    # Newest position seen per search: the list_time of the newest ad and the
+    # IDs of the ads published at that exact time.
+    def __init__(self):
+        self._marks = {}
+        self._updated = set()
+        self._removed = set()
+
+    def __contains__(self, group_id) -> bool:
+        return group_id in self._marks
+
+    def __len__(self) -> int:
+        return len(self._marks)
+
+    @property
+    def unsaved_count(self) -> int:
+        return len(self._updated) + len(self._removed)
+
+    def get(self, group_id) -> tuple[str, list] | None:
+        return self._marks.get(group_id)
+
+    def set(self, group_id, list_time: str, ad_ids: list):
+        mark = (list_time, list(ad_ids))
+        if self._marks.get(group_id) == mark:
+            return
+        self._marks[group_id] = mark
+        self._updated.add(group_id)
+        self._removed.discard(group_id)
+
+    def retain(self, group_ids):
+        group_ids = set(group_ids)
+        for group_id in [key for key in self._marks if key not in group_ids]:
+            del self._marks[group_id]
+            self._updated.discard(group_id)
+            self._removed.add(group_id)
+
+    def to_records(self) -> list:
+        return [
+            [group_id, list_time, ad_ids]
+            for group_id, (list_time, ad_ids) in self._marks.items()
+        ]
+
+    def load_records(self, records):
+        for group_id, list_time, ad_ids in records:
+            self._marks[group_id] = (list_time, list(ad_ids))
+        self._updated.clear()
+
+    def pop_changes(self) -> tuple[list, list]:
+        updated = [
+            [group_id, *self._marks[group_id]]
+            for group_id in self._updated
+            if group_id in self._marks
+        ]
+        removed = list(self._removed)
+        self._updated.clear()
+        self._removed.clear()
+        return updated, removed